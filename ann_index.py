@@ -0,0 +1,186 @@
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from quantization import quantize, quantized_scores
+
+# Rows assigned to their nearest centroid at a time
+ASSIGN_BLOCK_ROWS = 4096
+# k-means trains on at most this many sampled vectors per partition
+TRAIN_POINTS_PER_LIST = 32
+TRAIN_ITERATIONS = 10
+
+def default_lists(rows: int) -> int:
+    """Partition count for an index of this many rows: 4 * sqrt(rows)."""
+    return max(1, int(round(4 * np.sqrt(rows))))
+
+def unit_rows(codes: np.ndarray) -> np.ndarray:
+    """Rows upcast to float32 and L2-normalized.
+
+    Only directions matter for assigning partitions, so int8 codes need no
+    scales here.
+    """
+    vectors = np.asarray(codes, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class IVFIndex:
+    """Inverted-file index partitioning the rows of an embedding matrix.
+
+    Rows are clustered with spherical k-means; each row belongs to the
+    partition of its nearest centroid. A query scans only the rows of the
+    `probes` partitions whose centroids are nearest to it, so its cost grows
+    with rows / lists * probes instead of the row count. New rows are
+    assigned to the existing centroids; LocalVectorIndex.update_ivf()
+    retrains once the index has outgrown the size it was trained at.
+    """
+
+    FILE = "ivf.npz"
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, trained_rows: int):
+        self.centroids = centroids
+        self._assignments = assignments
+        self.trained_rows = trained_rows
+        # Assignments of rows appended by add() since the array was last consolidated
+        self._pending: List[np.ndarray] = []
+        # (row ids grouped by partition, start offset of each partition)
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def assignments(self) -> np.ndarray:
+        if self._pending:
+            self._assignments = np.concatenate([self._assignments] + self._pending)
+            self._pending = []
+        return self._assignments
+
+    def __len__(self) -> int:
+        return len(self._assignments) + sum(len(pending) for pending in self._pending)
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroids)
+
+    def assign(self, codes: np.ndarray) -> np.ndarray:
+        """Nearest centroid of every row."""
+        assignments = np.empty(len(codes), dtype=np.int32)
+        for start in range(0, len(codes), ASSIGN_BLOCK_ROWS):
+            block = unit_rows(codes[start:start + ASSIGN_BLOCK_ROWS])
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    @classmethod
+    def train(cls, codes: np.ndarray, lists: int = 0, iterations: int = TRAIN_ITERATIONS, seed: int = 0) -> "IVFIndex":
+        """Fit centroids on a sample of the rows with spherical k-means, then assign every row."""
+        lists = min(lists or default_lists(len(codes)), len(codes))
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(codes), lists * TRAIN_POINTS_PER_LIST)
+        sample = unit_rows(codes[np.sort(rng.choice(len(codes), sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, lists, replace=False)]
+        index = cls(centroids, np.zeros(0, dtype=np.int32), len(codes))
+        for _ in range(iterations):
+            labels = index.assign(sample)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=lists)
+            filled = np.flatnonzero(counts)
+            sums = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts[filled])[:-1]]))
+            centroids = np.empty_like(centroids)
+            centroids[filled] = unit_rows(sums)
+            # Restart empty partitions from random sample rows
+            empty = np.flatnonzero(counts == 0)
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+            index.centroids = centroids
+        index._assignments = index.assign(codes)
+        return index
+
+    def add(self, codes: np.ndarray):
+        """Assign appended rows to their nearest partitions."""
+        self._pending.append(self.assign(codes))
+        self._lists = None
+
+    def keep(self, rows: List[int]):
+        """Keep only these rows, in this order."""
+        self._assignments = self.assignments[rows]
+        self._lists = None
+
+    def needs_training(self, rows: int) -> bool:
+        # Partitions fitted at half or twice the current size are too coarse or too fine
+        return not self.trained_rows / 2 <= rows <= self.trained_rows * 2
+
+    def _grouped(self) -> Tuple[np.ndarray, np.ndarray]:
+        lists = self._lists
+        if lists is None:
+            assignments = self.assignments
+            order = np.argsort(assignments, kind="stable").astype(np.int64)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.lists))])
+            lists = self._lists = (order, offsets)
+        return lists
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        """Sorted ids of the rows in the `probes` partitions nearest to the query."""
+        order, offsets = self._grouped()
+        scores = self.centroids @ np.asarray(query, dtype=np.float32)
+        probes = min(probes, self.lists)
+        nearest = np.argpartition(-scores, probes - 1)[:probes]
+        rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in nearest])
+        rows.sort()
+        return rows
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["IVFIndex"]:
+        path = os.path.join(index_dir, cls.FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data["centroids"], data["assignments"], int(data["trained_rows"]))
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments, trained_rows=self.trained_rows)
+
+
+def ann_report(vectors: np.ndarray, queries: np.ndarray, top_k: int = 5, precision: str = "int8",
+               lists: int = 0, probes: Tuple[int, ...] = (1, 4, 16, 64)) -> Dict[str, Any]:
+    """recall@k and latency of IVF search at several probe counts, against exact search.
+
+    vectors and queries are L2-normalized; both searches score the same
+    quantized codes, so recall measures only what the partitioning misses.
+    """
+    codes, scales = quantize(vectors, precision)
+    start = time.perf_counter()
+    ivf = IVFIndex.train(codes, lists)
+    # Group the rows by partition, as the first search after a load does
+    ivf.candidates(queries[0], 1)
+    build = time.perf_counter() - start
+
+    def top(scores: np.ndarray) -> np.ndarray:
+        k = min(top_k, len(scores))
+        return np.argpartition(-scores, k - 1)[:k]
+
+    start = time.perf_counter()
+    exact = [set(top(quantized_scores(codes, scales, query)).tolist()) for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    rows = []
+    for probe in probes:
+        if probe > ivf.lists:
+            break
+        found = []
+        start = time.perf_counter()
+        for query in queries:
+            ids = ivf.candidates(query, probe)
+            scores = quantized_scores(codes[ids], None if scales is None else scales[ids], query)
+            found.append(set(ids[top(scores)].tolist()))
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "probes": probe,
+            f"recall@{top_k}": float(np.mean([len(a & b) / len(b) for a, b in zip(found, exact)])),
+            "search_ms": elapsed * 1000 / len(queries),
+            "scanned_fraction": probe / ivf.lists
+        })
+    return {
+        "rows": len(vectors),
+        "lists": ivf.lists,
+        "precision": precision,
+        "build_seconds": build,
+        "exact_search_ms": exact_ms,
+        "ivf": rows
+    }
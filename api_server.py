@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional
+import aiohttp
+from aiohttp import web
+from config import (
+    GROQ_API_KEY_DEFAULT,
+    OPENAI_API_KEY,
+    GROQ_MODELS,
+    OPENAI_MODELS,
+    LOCAL_INDEX_DIR,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    LLM_MAX_RETRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    API_HOST,
+    API_PORT,
+    API_MAX_CONCURRENCY,
+    API_WORKER_THREADS,
+    API_DEFAULT_PROVIDER,
+    API_DEFAULT_MODEL
+)
+from llm_service import LLMService, RETRY_STATUSES, filter_llm_output, get_response_cache
+from embedding_service import EmbeddingService
+from cache_service import SemanticCache
+from context_service import ContextAssembler
+from vector_store import read_index_version
+from metrics_service import metrics
+
+PROVIDERS = {
+    "Groq": (GROQ_API_KEY_DEFAULT, GROQ_MODELS),
+    "OpenAI": (OPENAI_API_KEY, OPENAI_MODELS)
+}
+
+class AsyncLLMService(LLMService):
+    """LLMService whose completions run on a shared aiohttp session.
+
+    Payloads, the response cache and the retry policy are inherited; only
+    the HTTP calls differ, so a waiting completion does not hold a thread.
+    The SQLite response cache can block on its lock, so its calls run on
+    the executor instead of the event loop.
+    """
+
+    def __init__(self, provider: str, api_key: str, model: str, http: aiohttp.ClientSession,
+                 executor: ThreadPoolExecutor):
+        super().__init__(provider, api_key, model)
+        self.http = http
+        self.executor = executor
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+
+    async def apost(self, payload: Dict[str, Any]) -> aiohttp.ClientResponse:
+        """POST to the provider, retrying transient failures like LLMService.post."""
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                response = await self.http.post(self.base_url, headers=headers, json=payload)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status not in RETRY_STATUSES or attempt == LLM_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response
+                delay = self.backoff_delay(attempt, response.headers.get("Retry-After"))
+                response.release()
+            metrics.inc("llm_retries")
+            await asyncio.sleep(delay)
+
+    async def agenerate_response(self, prompt: str) -> str:
+        """Non-blocking generate_response."""
+        payload = self.build_payload(prompt)
+        cache_key = self.cache_key(payload)
+        index_version = await self.run_blocking(read_index_version, LOCAL_INDEX_DIR)
+
+        cached = await self.run_blocking(self.cache.get, cache_key, index_version)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self.apost(payload)
+            async with response:
+                result = (await response.json())["choices"][0]["message"]["content"]
+            await self.run_blocking(self.cache.set, cache_key, result, index_version)
+            return result
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return f"[{self.provider} API Error] {str(e)}"
+        except Exception as e:
+            return f"[Error] {str(e)}"
+
+    async def astream_response(self, prompt: str) -> AsyncIterator[str]:
+        """Non-blocking stream_response: yields tokens from the server-sent events."""
+        self.stream_completed = False
+        payload = self.build_payload(prompt)
+        cache_key = self.cache_key(payload)
+        index_version = await self.run_blocking(read_index_version, LOCAL_INDEX_DIR)
+
+        cached = await self.run_blocking(self.cache.get, cache_key, index_version)
+        if cached is not None:
+            self.stream_completed = True
+            yield cached
+            return
+
+        try:
+            parts = []
+            response = await self.apost(dict(payload, stream=True))
+            async with response:
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip().decode("utf-8")
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    token = (choices[0].get("delta") or {}).get("content")
+                    if token:
+                        parts.append(token)
+                        yield token
+
+            await self.run_blocking(self.cache.set, cache_key, "".join(parts), index_version)
+            self.stream_completed = True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            yield f"[{self.provider} API Error] {str(e)}"
+        except Exception as e:
+            yield f"[Error] {str(e)}"
+
+
+class QueryAPI:
+    """The query pipeline of app.py behind an asyncio HTTP server.
+
+    Embedding and retrieval are CPU-bound or blocking and run on a small
+    thread pool; LLM calls are awaited on one aiohttp session. At most
+    max_concurrency queries are processed at once, the rest wait their turn.
+    """
+
+    def __init__(self, max_concurrency: int = API_MAX_CONCURRENCY, worker_threads: int = API_WORKER_THREADS):
+        self.max_concurrency = max_concurrency
+        self.embedding_service = EmbeddingService()
+        self.semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES)
+        self.context_assembler = ContextAssembler()
+        self.executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix="retrieval")
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.http: Optional[aiohttp.ClientSession] = None
+        self.in_flight = 0
+        metrics.register_collector("embedding_cache", self.embedding_service.cache_stats)
+        metrics.register_collector("query_encoder", self.embedding_service.encoder_stats)
+        metrics.register_collector("response_cache", lambda: get_response_cache().stats())
+        metrics.register_collector("semantic_cache", self.semantic_cache.stats)
+        metrics.register_collector("reranker", self.embedding_service.rerank_stats)
+
+    async def start(self, app: web.Application):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(sock_connect=LLM_CONNECT_TIMEOUT, sock_read=LLM_READ_TIMEOUT)
+        )
+
+    async def stop(self, app: web.Application):
+        await self.http.close()
+        self.executor.shutdown(wait=False)
+
+    def prepare(self, query: str, provider: str, model: str) -> Dict[str, Any]:
+        """Everything before the LLM call: embed, answer cache lookup, retrieval and prompt."""
+        with metrics.span("embed_query"):
+            query_embedding = self.embedding_service.embed_query(query)
+        is_comparison = self.embedding_service.is_comparison_query(query)
+        cache_scope = f"{provider}:{model}:{is_comparison}"
+        index_version = read_index_version(LOCAL_INDEX_DIR)
+        with metrics.span("semantic_cache"):
+            cached = self.semantic_cache.lookup(query_embedding, query, cache_scope, index_version)
+        metrics.inc("semantic_cache_hits" if cached is not None else "semantic_cache_misses")
+        state = {
+            "query": query,
+            "query_embedding": query_embedding,
+            "is_comparison": is_comparison,
+            "cache_scope": cache_scope,
+            "index_version": index_version,
+            "cached": cached
+        }
+        if cached is not None:
+            return state
+
+        specs = self.embedding_service.comparison_specs(query) if is_comparison else None
+        if specs is not None:
+            context, results = specs
+            metrics.inc("spec_table_hits")
+        else:
+            with metrics.span("search_documents"):
+                if is_comparison:
+                    results = self.embedding_service.search_comparison(query)
+                else:
+                    results = self.embedding_service.search_documents(query_embedding, query=query)
+            with metrics.span("assemble_context"):
+                context, results = self.context_assembler.build(results, model)
+        state["prompt"] = LLMService.format_prompt(context, query, is_comparison)
+        state["sources"] = self.embedding_service.format_sources(results)
+        return state
+
+    def finish(self, state: Dict[str, Any], response: str, complete: bool = True) -> str:
+        """Filter the completion and remember it for paraphrased questions.
+
+        Incomplete completions (a stream that broke off) are not remembered.
+        """
+        response = filter_llm_output(response)
+        metrics.inc("prompt_tokens", self.context_assembler.estimate_tokens(state["prompt"]))
+        metrics.inc("response_tokens", self.context_assembler.estimate_tokens(response))
+        if complete and not LLMService.is_error_response(response):
+            self.semantic_cache.store(
+                state["query_embedding"],
+                state["query"],
+                state["cache_scope"],
+                state["index_version"],
+                {"response": response, "sources": state["sources"]}
+            )
+        return response
+
+    @staticmethod
+    def error(message: str, status: int = 400) -> web.Response:
+        return web.json_response({"error": message}, status=status)
+
+    async def handle_query(self, request: web.Request) -> web.StreamResponse:
+        """POST /query {"query", "provider"?, "model"?, "api_key"?, "stream"?}."""
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return self.error("Request body must be JSON")
+        if not isinstance(body, dict) or not str(body.get("query") or "").strip():
+            return self.error("Missing 'query'")
+        provider = body.get("provider") or API_DEFAULT_PROVIDER
+        if provider not in PROVIDERS:
+            return self.error(f"Unknown provider '{provider}'; use one of {', '.join(PROVIDERS)}")
+        default_key, models = PROVIDERS[provider]
+        model = body.get("model") or (API_DEFAULT_MODEL if provider == API_DEFAULT_PROVIDER else models[0])
+        api_key = body.get("api_key") or default_key
+        stream = bool(body.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
+
+        async with self.semaphore:
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                state = await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(self.prepare, str(body["query"]).strip(), provider, model)
+                )
+                llm = AsyncLLMService(provider, api_key, model, self.http, self.executor)
+                if stream:
+                    return await self.stream_answer(request, llm, state, start)
+                if state["cached"] is not None:
+                    answer, sources = state["cached"]["response"], state["cached"]["sources"]
+                else:
+                    with metrics.span("llm"):
+                        response = await llm.agenerate_response(state["prompt"])
+                    answer, sources = self.finish(state, response), state["sources"]
+                return web.json_response({
+                    "answer": answer,
+                    "sources": sources,
+                    "is_comparison": state["is_comparison"],
+                    "cached": state["cached"] is not None
+                })
+            finally:
+                metrics.observe("query", time.perf_counter() - start)
+                self.in_flight -= 1
+
+    async def stream_answer(self, request: web.Request, llm: AsyncLLMService,
+                            state: Dict[str, Any], start: float) -> web.StreamResponse:
+        """Send tokens as server-sent events, then a final event with the filtered answer."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(event: Dict[str, Any]):
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+        if state["cached"] is not None:
+            answer, sources = state["cached"]["response"], state["cached"]["sources"]
+            await send({"token": answer})
+        else:
+            parts = []
+            with metrics.span("llm"):
+                async for token in llm.astream_response(state["prompt"]):
+                    if not parts:
+                        metrics.observe("first_token", time.perf_counter() - start)
+                    parts.append(token)
+                    await send({"token": token})
+            answer, sources = self.finish(state, "".join(parts), llm.stream_completed), state["sources"]
+        await send({
+            "done": True,
+            "answer": answer,
+            "sources": sources,
+            "is_comparison": state["is_comparison"],
+            "cached": state["cached"] is not None
+        })
+        await response.write_eof()
+        return response
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /health: 200 once the models are loaded, 503 while warming up or after a failed load."""
+        ready = self.embedding_service.is_ready()
+        return web.json_response({
+            "status": "ok" if ready else "loading",
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "index_version": read_index_version(LOCAL_INDEX_DIR)
+        }, status=200 if ready else 503)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.prometheus_text(), content_type="text/plain")
+
+def create_app(max_concurrency: int = API_MAX_CONCURRENCY, worker_threads: int = API_WORKER_THREADS) -> web.Application:
+    api = QueryAPI(max_concurrency, worker_threads)
+    app = web.Application()
+    app.on_startup.append(api.start)
+    app.on_cleanup.append(api.stop)
+    app.router.add_post("/query", api.handle_query)
+    app.router.add_get("/health", api.handle_health)
+    app.router.add_get("/metrics", api.handle_metrics)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the scanner support pipeline over HTTP.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--concurrency", type=int, default=API_MAX_CONCURRENCY,
+                        help="queries processed at once (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=API_WORKER_THREADS,
+                        help="threads for embedding and retrieval (default: %(default)s)")
+    args = parser.parse_args()
+    web.run_app(create_app(args.concurrency, args.threads), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
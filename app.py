@@ -1,16 +1,31 @@
+import time
+APP_START = time.perf_counter()
 import streamlit as st
-import re
 from config import (
     GROQ_API_KEY_DEFAULT,
     GROQ_MODELS,
     OPENAI_MODELS,
     PAGE_TITLE,
     PAGE_ICON,
-    LAYOUT
+    LAYOUT,
+    STREAM_RESPONSES,
+    LOCAL_INDEX_DIR,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    METRICS_HOST,
+    METRICS_PORT,
+    SHOW_DIAGNOSTICS
 )
-from llm_service import LLMService
+from llm_service import LLMService, filter_llm_output, get_response_cache
 from embedding_service import EmbeddingService
 from ui_service import UIService
+from cache_service import SemanticCache
+from context_service import ContextAssembler
+from vector_store import read_index_version
+from metrics_service import metrics, start_metrics_server
+
+# Heavy libraries (torch, sentence_transformers, supabase) are imported later by background loaders
+metrics.record_startup("imports", time.perf_counter() - APP_START)
 
 # Configure the page - must be the first Streamlit command
 st.set_page_config(
@@ -33,28 +48,42 @@ with st.container():
             </div>
         """, unsafe_allow_html=True)
 
-def filter_llm_output(text):
-    # Remove lines that look like reasoning or intro/summary statements
-    lines = text.split('\n')
-    filtered = []
-    for line in lines:
-        if re.match(r"^(Okay|Let me|Looking at|I should|So, |First,|Wait,|Based on|In summary|To answer|I don't see|Just the facts|I also need|I'll|\s*$)", line.strip()):
-            continue
-        filtered.append(line)
-    return '\n'.join(filtered).strip()
-
 @st.cache_resource
 def create_ui_service():
     return UIService()
 
+@st.cache_resource
+def create_embedding_service():
+    # Shared by all sessions; the model and vector store inside are process-wide
+    return EmbeddingService()
+
+@st.cache_resource
+def create_semantic_cache():
+    return SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES)
+
+@st.cache_resource
+def create_context_assembler():
+    return ContextAssembler()
+
+@st.cache_resource
+def setup_metrics(_embedding_service, _semantic_cache):
+    # Cache statistics are polled whenever metrics are exported
+    metrics.register_collector("embedding_cache", _embedding_service.cache_stats)
+    metrics.register_collector("query_encoder", _embedding_service.encoder_stats)
+    metrics.register_collector("response_cache", lambda: get_response_cache().stats())
+    metrics.register_collector("semantic_cache", _semantic_cache.stats)
+    metrics.register_collector("reranker", _embedding_service.rerank_stats)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+
 def main():
     # Initialize services with caching
     ui = create_ui_service()
     
-    # Only initialize embedding service when needed
-    if 'embedding_service' not in st.session_state:
-        st.session_state.embedding_service = EmbeddingService()
-    embedding_service = st.session_state.embedding_service
+    embedding_service = create_embedding_service()
+    semantic_cache = create_semantic_cache()
+    context_assembler = create_context_assembler()
+    setup_metrics(embedding_service, semantic_cache)
     
     # Setup sidebar and get LLM configuration
     llm_provider, groq_api_key, groq_model, openai_api_key, openai_model = ui.setup_sidebar(
@@ -65,6 +94,13 @@ def main():
     
     # Setup document downloads
     ui.setup_document_downloads()
+    ui.display_cache_stats("Answer cache", semantic_cache.stats())
+    rerank_stats = embedding_service.rerank_stats()
+    if rerank_stats:
+        ui.display_rerank_stats(rerank_stats)
+    if not embedding_service.is_ready():
+        st.sidebar.caption("Loading models in the background...")
+    show_diagnostics = st.sidebar.checkbox("Show diagnostics", value=SHOW_DIAGNOSTICS)
     
     # Initialize chat history
     if "chat_history" not in st.session_state:
@@ -83,6 +119,7 @@ def main():
     
     # Get user input
     user_input = st.chat_input("Ask me anything about scanners, troubleshooting, or comparisons...")
+    metrics.record_startup("first_render", time.perf_counter() - APP_START)
     
     # Check if there's a pending user input from the previous run
     if "pending_user_input" in st.session_state and st.session_state.pending_user_input:
@@ -99,43 +136,103 @@ def main():
         # Immediately display the user message
         st.chat_message("user").write(user_input)
         
-        # Add user message to chat history
+        # Add user message to chat history and jump back to the latest page
         st.session_state.chat_history.append({"role": "user", "content": user_input})
+        st.session_state.history_page = 0
         
         # Show a spinner while processing to indicate activity
+        query_start = time.perf_counter()
         with st.spinner('Searching for relevant information...'):
-            # Generate embeddings and search for relevant documents
-            query_embedding = embedding_service.embed_query(user_input)
-            results = embedding_service.search_documents(query_embedding)
-            
-            # Prepare context and check if it's a comparison query
-            context = "\n".join([r["content"] for r in results])
+            # Reuse the answer of a previously answered paraphrase if there is one
+            with metrics.span("embed_query"):
+                query_embedding = embedding_service.embed_query(user_input)
             is_comparison = embedding_service.is_comparison_query(user_input)
+            model = groq_model if llm_provider == "Groq" else openai_model
+            cache_scope = f"{llm_provider}:{model}:{is_comparison}"
+            index_version = read_index_version(LOCAL_INDEX_DIR)
+            with metrics.span("semantic_cache"):
+                cached = semantic_cache.lookup(query_embedding, user_input, cache_scope, index_version)
+            metrics.inc("semantic_cache_hits" if cached is not None else "semantic_cache_misses")
+            
+            if cached is None:
+                # Products found in the spec table are compared from their exact spec rows
+                specs = embedding_service.comparison_specs(user_input) if is_comparison else None
+                if specs is not None:
+                    context, results = specs
+                    metrics.inc("spec_table_hits")
+                else:
+                    # Search for relevant documents, per product for comparisons
+                    with metrics.span("search_documents"):
+                        if is_comparison:
+                            results = embedding_service.search_comparison(user_input)
+                        else:
+                            results = embedding_service.search_documents(query_embedding, query=user_input)
+                    
+                    # Prepare de-duplicated, labelled context within the model's token budget
+                    with metrics.span("assemble_context"):
+                        context, results = context_assembler.build(results, model)
         
-        # Initialize LLM service
-        llm = LLMService(
-            provider=llm_provider,
-            api_key=groq_api_key if llm_provider == "Groq" else openai_api_key,
-            model=groq_model if llm_provider == "Groq" else openai_model
-        )
+        if cached is not None:
+            response = cached["response"]
+            sources = cached["sources"]
+        else:
+            # Initialize LLM service
+            llm = LLMService(
+                provider=llm_provider,
+                api_key=groq_api_key if llm_provider == "Groq" else openai_api_key,
+                model=model
+            )
+            
+            # Generate prompt and get response
+            prompt = llm.format_prompt(context, user_input, is_comparison)
+            with metrics.span("llm"):
+                if STREAM_RESPONSES:
+                    # Show tokens as they arrive, then replace with the formatted answer
+                    placeholder = st.empty()
+                    parts = []
+                    for token in llm.stream_response(prompt):
+                        if not parts:
+                            metrics.observe("first_token", time.perf_counter() - query_start)
+                        parts.append(token)
+                        placeholder.markdown("".join(parts) + "▌")
+                    placeholder.empty()
+                    response = "".join(parts)
+                    complete = llm.stream_completed
+                else:
+                    response = llm.generate_response(prompt)
+                    complete = True
+            response = filter_llm_output(response)
+            sources = embedding_service.format_sources(results)
+            metrics.inc("prompt_tokens", context_assembler.estimate_tokens(prompt))
+            metrics.inc("response_tokens", context_assembler.estimate_tokens(response))
+            
+            # A stream that broke off ends in an error message after partial tokens
+            if complete and not llm.is_error_response(response):
+                semantic_cache.store(
+                    query_embedding,
+                    user_input,
+                    cache_scope,
+                    index_version,
+                    {"response": response, "sources": sources}
+                )
         
-        # Generate prompt and get response
-        prompt = llm.format_prompt(context, user_input, is_comparison)
-        response = llm.generate_response(prompt)
-        response = filter_llm_output(response)
+        # Display the response
+        with metrics.span("render"):
+            rendered = ui.display_response(response, sources, is_comparison)
         
-        # Add assistant response to chat history
+        # Add assistant response to chat history with its rendered form for reruns
         st.session_state.chat_history.append({
             "role": "assistant",
             "content": response,
-            "sources": embedding_service.format_sources(results),
-            "is_table": is_comparison
+            "sources": sources,
+            "is_table": is_comparison,
+            "rendered": rendered
         })
-        
-        # Display the response
-        ui.display_response(response, embedding_service.format_sources(results), is_comparison)
+        metrics.observe("query", time.perf_counter() - query_start)
+        metrics.record_startup("first_query", time.perf_counter() - query_start)
 
-    
+    if show_diagnostics:
+        ui.display_diagnostics(metrics.snapshot())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
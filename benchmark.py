@@ -0,0 +1,365 @@
+"""End-to-end performance benchmark with local stand-ins for Supabase and the LLM APIs.
+
+Ingests the documents under INPUT_DIRS into a temporary local index, then runs
+every benchmark query through the same stages as app.main: embed_query,
+search_documents, context assembly, format_prompt, generate_response (against
+a mock OpenAI-compatible server), filter_llm_output and
+UIService.format_response. Results are written as JSON so runs on different
+commits can be compared with --compare.
+
+    python benchmark.py --iterations 5 --llm-latency-ms 300
+    python benchmark.py --compare benchmark_results/<previous>.json
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+import config
+import embedding_service
+import ingest_documents
+import llm_service
+from embedding_service import EmbeddingService, get_embedder, get_query_cache
+from llm_service import LLMService, filter_llm_output
+from context_service import ContextAssembler
+from ui_service import UIService
+from document_parser import PARSE_WORKERS
+from quantization import precision_report
+from ann_index import ann_report
+from vector_store import LocalVectorIndex
+
+RESULTS_DIR = "benchmark_results"
+
+DEFAULT_QUERIES = [
+    "What is the scan speed of the Canon CR-120?",
+    "Does the Fujitsu fi-8170 support duplex scanning?",
+    "Compare Canon 120 vs 208",
+    "How fast does the Alaris i3000 scan?",
+    "What is the maximum document size for the CZUR ET-24?",
+    "Kodak S2050 versus S2070",
+    "Which scanners support UV reading?",
+    "What is the daily duty cycle of the fi-7460?"
+]
+
+MOCK_RESPONSE = (
+    "- Scan speed: 60 ppm / 120 ipm\n"
+    "- Duplex scanning: supported\n"
+    "- Daily duty cycle: 9,000 sheets\n"
+    "- Interface: USB 3.2\n"
+    "Sources: benchmark"
+)
+
+# Percentage increase of p50/p95 over the baseline reported as a regression
+REGRESSION_THRESHOLD = 10.0
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions endpoint with configurable latency."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Send small SSE events immediately instead of waiting on delayed ACKs
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.latency)
+        if body.get("stream"):
+            # Chunked transfer encoding, one SSE event per chunk, like the real APIs
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            events = [
+                {"choices": [{"delta": {"content": token + " "}}]}
+                for token in MOCK_RESPONSE.split(" ")
+            ]
+            try:
+                for event in events:
+                    self.write_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+                    time.sleep(self.server.token_latency)
+                self.write_chunk(b"data: [DONE]\n\n")
+                self.write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading early
+                self.close_connection = True
+            return
+        payload = json.dumps({"choices": [{"message": {"content": MOCK_RESPONSE}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_mock_llm(latency_ms: float, token_latency_ms: float) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockLLMHandler)
+    server.latency = latency_ms / 1000
+    server.token_latency = token_latency_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds."""
+    values = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99))
+    }
+
+def use_local_stand_ins(index_dir: str, input_dirs: List[str]):
+    """Point ingest and the services at a temporary local index instead of Supabase."""
+    ingest_documents.UPLOAD_TO_SUPABASE = False
+    ingest_documents.LOCAL_INDEX_DIR = index_dir
+    ingest_documents.MANIFEST_PATH = os.path.join(index_dir, "manifest.json")
+    ingest_documents.INPUT_DIRS = input_dirs
+    embedding_service.RETRIEVAL_BACKEND = "local"
+    embedding_service.LOCAL_INDEX_DIR = index_dir
+    llm_service.LOCAL_INDEX_DIR = index_dir
+    llm_service.RESPONSE_CACHE_PATH = os.path.join(index_dir, "response_cache.sqlite3")
+
+def run_ingest(workers: int) -> Dict[str, Any]:
+    # Share the model with the query benchmark instead of loading it twice
+    ingest_documents.embedder = get_embedder()
+    files = ingest_documents.list_input_files()
+    start = time.perf_counter()
+    chunks = ingest_documents.ingest_full(files, workers)
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "chunks": chunks,
+        "seconds": elapsed,
+        "chunks_per_sec": chunks / elapsed if elapsed > 0 else 0.0,
+        "workers": workers
+    }
+
+def embed_corpus(index_dir: str, queries: List[str]):
+    """Freshly computed, normalized float32 embeddings of the indexed chunks and of the queries."""
+    embedder = get_embedder()
+    chunks = LocalVectorIndex.load(index_dir).chunks
+    vectors = embedder.encode([chunk["content"] for chunk in chunks], batch_size=ingest_documents.EMBED_BATCH_SIZE, convert_to_numpy=True)
+    query_vectors = embedder.encode(queries, convert_to_numpy=True)
+    return LocalVectorIndex.normalize(vectors), LocalVectorIndex.normalize(query_vectors)
+
+def synthesize_corpus(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """size normalized vectors spread around the real ones.
+
+    Each is a random blend of two chunk embeddings plus noise, so the corpus
+    fills the regions real documents occupy instead of clustering on copies.
+    """
+    rng = np.random.default_rng(seed)
+    synthetic = np.empty((size, vectors.shape[1]), dtype=np.float32)
+    for start in range(0, size, 65536):
+        n = min(65536, size - start)
+        blend = rng.random((n, 1), dtype=np.float32)
+        block = blend * vectors[rng.integers(len(vectors), size=n)] + (1 - blend) * vectors[rng.integers(len(vectors), size=n)]
+        block += rng.standard_normal(block.shape, dtype=np.float32) * (0.5 / np.sqrt(vectors.shape[1]))
+        synthetic[start:start + n] = LocalVectorIndex.normalize(block)
+    return synthetic
+
+def run_queries(queries: List[str], iterations: int, llm_url: str) -> Dict[str, Any]:
+    embedding = EmbeddingService()
+    assembler = ContextAssembler()
+    ui = UIService()
+    llm = LLMService(provider="Groq", api_key="benchmark", model=config.GROQ_MODELS[0])
+    llm.base_url = llm_url
+    stages: Dict[str, List[float]] = {}
+
+    def timed(stage: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        stages.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    for _ in range(iterations):
+        for query in queries:
+            # Measure the uncached path of every stage
+            get_query_cache().clear()
+            llm.cache.clear()
+            start = time.perf_counter()
+            query_embedding = timed("embed_query", embedding.embed_query, query)
+            is_comparison = embedding.is_comparison_query(query)
+            specs = timed("comparison_specs", embedding.comparison_specs, query) if is_comparison else None
+            if specs is not None:
+                context, results = specs
+            else:
+                if is_comparison:
+                    results = timed("search_documents", embedding.search_comparison, query)
+                else:
+                    results = timed("search_documents", embedding.search_documents, query_embedding, query=query)
+                context, results = timed("assemble_context", assembler.build, results, llm.model)
+            prompt = timed("format_prompt", llm.format_prompt, context, query, is_comparison)
+            response = timed("generate_response", llm.generate_response, prompt)
+            response = timed("filter_llm_output", filter_llm_output, response)
+            timed("format_response", ui.format_response, response)
+            stages.setdefault("total", []).append(time.perf_counter() - start)
+
+            # Time to first token of the streaming path
+            llm.cache.clear()
+            start = time.perf_counter()
+            stream = llm.stream_response(prompt)
+            next(stream, None)
+            stages.setdefault("first_token", []).append(time.perf_counter() - start)
+            for _ in stream:
+                pass
+
+    return {stage: summarize(samples) for stage, samples in stages.items()}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+def compare(results: Dict[str, Any], baseline_path: str):
+    """Print the change of every metric against a previous results file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path} (commit {baseline.get('commit')}):")
+    old_rate = baseline["ingest"]["chunks_per_sec"]
+    new_rate = results["ingest"]["chunks_per_sec"]
+    if old_rate:
+        print(f"  ingest chunks/sec: {old_rate:.1f} -> {new_rate:.1f} ({(new_rate - old_rate) / old_rate:+.0%})")
+    for stage, stats in results["query"].items():
+        old = baseline["query"].get(stage)
+        if not old:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            change = (stats[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+            print(f"  {stage:18s} {metric}: {old[metric]:9.2f} -> {stats[metric]:9.2f} ({change:+.0f}%){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and the query pipeline against local stand-ins.")
+    parser.add_argument("--iterations", type=int, default=5, help="Passes over the query set.")
+    parser.add_argument("--queries", help="Text file with one query per line (default: built-in set).")
+    parser.add_argument("--input-dir", action="append", help="Document directory to ingest (default: INPUT_DIRS).")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="Parser processes during ingest.")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Mock LLM time before the response starts.")
+    parser.add_argument("--token-latency-ms", type=float, default=5, help="Mock LLM delay between streamed tokens.")
+    parser.add_argument("--ann-chunks", type=int, default=100000,
+                        help="Synthetic corpus size for the IVF recall@k benchmark against exact search (0 skips it).")
+    parser.add_argument("--output", help=f"Results file (default: {RESULTS_DIR}/<timestamp>_<commit>.json).")
+    parser.add_argument("--compare", help="Previous results file to compare against.")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    index_dir = tempfile.mkdtemp(prefix="benchmark_index_")
+    server = start_mock_llm(args.llm_latency_ms, args.token_latency_ms)
+    try:
+        use_local_stand_ins(index_dir, args.input_dir or config.INPUT_DIRS)
+
+        start = time.perf_counter()
+        get_embedder()
+        model_load = time.perf_counter() - start
+
+        ingest = run_ingest(args.workers)
+        rss_after_ingest = peak_rss_mb()
+        vectors, query_vectors = embed_corpus(index_dir, queries)
+        precision = precision_report(vectors, query_vectors, config.TOP_K_RESULTS)
+        ann = None
+        if args.ann_chunks:
+            ann = ann_report(
+                synthesize_corpus(vectors, args.ann_chunks),
+                query_vectors,
+                config.TOP_K_RESULTS,
+                config.INDEX_PRECISION,
+                config.IVF_LISTS
+            )
+        query = run_queries(queries, args.iterations, f"http://127.0.0.1:{server.server_port}/v1/chat/completions")
+    finally:
+        server.shutdown()
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    commit = git_commit()
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "settings": {
+            "iterations": args.iterations,
+            "queries": len(queries),
+            "llm_latency_ms": args.llm_latency_ms,
+            "token_latency_ms": args.token_latency_ms,
+            "embedding_model": config.EMBEDDING_MODEL,
+            "top_k": config.TOP_K_RESULTS,
+            "index_precision": config.INDEX_PRECISION
+        },
+        "model_load_seconds": model_load,
+        "ingest": ingest,
+        "query": query,
+        "index_precision": precision,
+        "ann": ann,
+        "memory": {
+            "peak_rss_mb_after_ingest": rss_after_ingest,
+            "peak_rss_mb": peak_rss_mb()
+        }
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_{commit or 'nocommit'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nIngest: {ingest['chunks']} chunks from {ingest['files']} files in {ingest['seconds']:.1f}s "
+          f"({ingest['chunks_per_sec']:.1f} chunks/sec, {ingest['workers']} workers)")
+    print(f"{'stage':20s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for stage, stats in query.items():
+        print(f"{stage:20s} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+    recall = f"recall@{config.TOP_K_RESULTS}"
+    print(f"\n{'precision':10s} {'bytes/vec':>9s} {'index MB':>9s} {recall:>9s} {'max err':>9s} {'search ms':>9s}")
+    for row in precision:
+        print(f"{row['precision']:10s} {row['bytes_per_vector']:9.0f} {row['index_mb']:9.2f} "
+              f"{row[recall]:9.3f} {row['max_score_error']:9.4f} {row['search_ms']:9.3f}")
+    if ann:
+        print(f"\nIVF over {ann['rows']} synthetic chunks ({ann['lists']} partitions, built in {ann['build_seconds']:.1f}s); "
+              f"exact search {ann['exact_search_ms']:.2f} ms")
+        print(f"{'probes':>6s} {recall:>9s} {'search ms':>9s}")
+        for row in ann["ivf"]:
+            print(f"{row['probes']:6d} {row[recall]:9.3f} {row['search_ms']:9.3f}")
+    print(f"Peak RSS: {results['memory']['peak_rss_mb']} MB")
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+import numpy as np
+from lexical_index import tokenize
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with optional TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class ResponseCache:
+    """Disk-backed LLM response cache shared by all sessions and processes.
+
+    Entries are tagged with the document index version they were generated
+    against. Storing an entry under a new version drops every entry of older
+    versions, and lookups only match the current version, so answers never
+    outlive a re-ingest.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " index_version TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def get(self, key: str, index_version: str) -> Optional[str]:
+        now = time.time()
+        min_created = now - self.ttl if self.ttl is not None else float("-inf")
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND index_version = ? AND created_at > ?",
+                (key, index_version, min_created)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str, index_version: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE index_version != ?", (index_version,))
+            if self.ttl is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, index_version, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, index_version, now, now)
+            )
+            # Evict least recently used entries beyond the size limit
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SemanticCache:
+    """In-memory answer cache keyed on query-embedding similarity.
+
+    A lookup hits when a previously answered query in the same scope and
+    against the same index version has a cosine similarity of at least
+    `threshold` with the new query and names the same model numbers.
+    Paraphrases of an answered question are then served without retrieval
+    or an LLM call. MiniLM places "fi-7140 scan speed" and "fi-7160 scan
+    speed" very close together, so similarity alone would answer one
+    product's question with another's answer.
+    """
+
+    def __init__(self, threshold: float, max_entries: int = 1000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._index_version: Optional[str] = None
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    @staticmethod
+    def model_terms(query: str) -> frozenset:
+        """Terms of the query containing a digit: model numbers such as "fi7140" or "3000"."""
+        return frozenset(term for term in tokenize(query) if any(c.isdigit() for c in term))
+
+    def _check_version(self, index_version: str):
+        # Everything cached belongs to one index version; a new one drops it all
+        if index_version != self._index_version:
+            self._vectors = None
+            self._entries = []
+            self._index_version = index_version
+
+    def lookup(self, embedding: np.ndarray, query_text: str, scope: str, index_version: str) -> Optional[Dict[str, Any]]:
+        """Return the stored answer of the most similar cached query, if close enough."""
+        query = self._normalize(embedding)
+        terms = self.model_terms(query_text)
+        with self._lock:
+            self._check_version(index_version)
+            best = None
+            if self._entries:
+                scores = self._vectors @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    if self._entries[i]["scope"] == scope and self._entries[i]["terms"] == terms:
+                        best = i
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            entry["last_used"] = time.monotonic()
+            return dict(entry["answer"], similarity=float(scores[best]))
+
+    def store(self, embedding: np.ndarray, query_text: str, scope: str, index_version: str, answer: Dict[str, Any]):
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if len(self._entries) >= self.max_entries:
+                # Evict the least recently used entry
+                oldest = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                self._vectors = np.delete(self._vectors, oldest, axis=0)
+                del self._entries[oldest]
+            self._vectors = vector[None, :] if self._vectors is None else np.vstack([self._vectors, vector])
+            self._entries.append({
+                "scope": scope,
+                "terms": self.model_terms(query_text),
+                "answer": answer,
+                "last_used": time.monotonic()
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
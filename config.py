@@ -27,15 +27,114 @@ GROQ_MODELS = [
     "allam-2-7b"
 ]
 OPENAI_MODELS = ["gpt-3.5-turbo", "gpt-4"]
+# Render LLM responses token by token as they are generated
+STREAM_RESPONSES = True
+
+# LLM HTTP Configuration
+LLM_POOL_SIZE = 10  # keep-alive connections per provider
+LLM_CONNECT_TIMEOUT = 5  # seconds
+LLM_READ_TIMEOUT = 60  # seconds between bytes received
+LLM_MAX_RETRIES = 3  # on connection errors, timeouts, 429 and 5xx
+LLM_BACKOFF_BASE = 0.5  # seconds; doubled per attempt with full jitter
+LLM_BACKOFF_MAX = 20  # seconds; also caps Retry-After
 
 # Embedding Configuration
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Concurrent queries arriving within this window are encoded in one batch
+QUERY_BATCH_WINDOW_MS = 5
+QUERY_BATCH_MAX = 32
+# A failed background load of a model or client is retried on the next use after this many seconds
+LOAD_RETRY_INTERVAL = 30
 TOP_K_RESULTS = 5
 
+# Retrieval Configuration
+# "supabase" queries the match_documents RPC; "local" searches the on-disk
+# index that ingest_documents.py always writes to LOCAL_INDEX_DIR.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "supabase")
+LOCAL_INDEX_DIR = "vector_index"
+# Storage precision of the local index embeddings: "int8" (a quarter of the
+# size, one float32 scale per vector, fastest to search), "float16" (half) or
+# "float32". Compare recall and size with `python benchmark.py`; the next
+# ingest converts an existing index.
+INDEX_PRECISION = os.getenv("INDEX_PRECISION", "int8")
+# Local vector search: "exact" scores every chunk; "ivf" scores only the chunks
+# in the IVF_PROBES k-means partitions nearest to the query. Ingest builds the
+# partitions once the index reaches IVF_MIN_CHUNKS; smaller indexes are
+# always searched exactly.
+VECTOR_SEARCH = os.getenv("VECTOR_SEARCH", "ivf")
+IVF_MIN_CHUNKS = 20000
+# Partition count; 0 uses 4 * sqrt(chunks). Retrained when the index halves or doubles
+IVF_LISTS = 0
+# Partitions scanned per query: more raises recall and latency (see benchmark.py --ann-chunks)
+IVF_PROBES = 16
+# Fuse vector results with a BM25 keyword index (built by ingest) through
+# reciprocal-rank fusion, so exact model numbers like "CR-120" rank well
+HYBRID_SEARCH = True
+HYBRID_CANDIDATES = 20  # results fetched from each retriever before fusion
+RRF_K = 60
+# Comparison queries retrieve for each compared product separately
+COMPARISON_MAX_ENTITIES = 4
+COMPARISON_RESULTS_PER_ENTITY = 3
+# Answer comparisons of products found in ingested spec spreadsheets from the
+# structured spec table instead of retrieved chunks
+SPEC_TABLE_ENABLED = True
+# Optional second stage: over-fetch candidates and rescore them with a CPU cross-encoder
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 50
+RERANK_CACHE_SIZE = 20000  # cached (query, chunk content) pair scores
+
+# Cache Configuration
+# Query embeddings shared by all sessions, keyed on the normalized query text
+EMBEDDING_CACHE_SIZE = 2048
+EMBEDDING_CACHE_TTL = 24 * 3600  # seconds; None disables expiry
+# LLM responses shared by all sessions and app restarts; cleared on re-ingest
+RESPONSE_CACHE_PATH = "response_cache.sqlite3"
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # seconds; None disables expiry
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+# Answers reused for new queries at least this cosine-similar to an answered one
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+
+# Context Configuration
+# Prompt context budget in tokens per model; unknown models use the default
+CONTEXT_TOKEN_BUDGET_DEFAULT = 3000
+CONTEXT_TOKEN_BUDGETS = {
+    "llama3-8b-8192": 2500,
+    "llama-3.1-8b-instant": 2500,
+    "gemma2-9b-it": 2500,
+    "allam-2-7b": 1500,
+    "gpt-3.5-turbo": 2000
+}
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+# Chunks whose word 3-gram Jaccard similarity with a selected chunk reaches this are dropped
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Query API Configuration (api_server.py)
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_MAX_CONCURRENCY = 200  # queries processed at once; the rest wait
+API_WORKER_THREADS = 8  # threads for embedding and retrieval
+API_DEFAULT_PROVIDER = "Groq"
+API_DEFAULT_MODEL = GROQ_MODELS[0]  # used when a request names neither provider nor model
+
+# Metrics Configuration
+# Prometheus text exposition of pipeline latencies and counters at http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464  # None disables the endpoint
+METRICS_WINDOW = 500  # recent observations per stage used for percentiles
+SHOW_DIAGNOSTICS = False  # default state of the sidebar diagnostics panel
+
 # UI Configuration
 PAGE_TITLE = "Scanner Support Agent"
 PAGE_ICON = "🤖"
 LAYOUT = "wide"
+# Chat messages shown per page; older turns are paginated
+CHAT_HISTORY_WINDOW = 20
+# The sidebar document list is re-checked for added or removed files at most this often
+DOCUMENT_CATALOG_CHECK_SECONDS = 2.0
+# Prepared documents kept in memory for download, shared by all sessions
+DOWNLOAD_CACHE_ENTRIES = 8
 
 # System Prompts
 SYSTEM_PROMPT = """
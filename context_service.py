@@ -0,0 +1,93 @@
+import re
+from typing import List, Dict, Any, Tuple
+from config import (
+    CONTEXT_TOKEN_BUDGETS,
+    CONTEXT_TOKEN_BUDGET_DEFAULT,
+    CHARS_PER_TOKEN,
+    NEAR_DUPLICATE_THRESHOLD
+)
+
+# Longest overlap looked for between neighbouring chunks of the same page
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 20
+
+class ContextAssembler:
+    """Builds the prompt context from ranked search results.
+
+    Chunks are taken in relevance order. Text that overlaps an already
+    selected chunk of the same page is trimmed, near-identical chunks are
+    dropped, and packing stops at the token budget of the selected model.
+    Each chunk is labelled with its source and page or row.
+    """
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+
+    @staticmethod
+    def token_budget(model: str) -> int:
+        return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET_DEFAULT)
+
+    @staticmethod
+    def label(chunk: Dict[str, Any]) -> str:
+        """Compact source label, e.g. "[fi-7140.pdf p.2]" or "[Canon 120 VS 208.xlsx row 4]"."""
+        source = chunk.get("source") or "unknown"
+        if chunk.get("page_num"):
+            return f"[{source} p.{chunk['page_num']}]"
+        row = (chunk.get("metadata") or {}).get("row")
+        if row is not None:
+            return f"[{source} row {row}]"
+        return f"[{source}]"
+
+    @staticmethod
+    def shingles(text: str, size: int = 3) -> set:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) <= size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    @staticmethod
+    def trim_overlap(previous: str, text: str) -> str:
+        """Drop the prefix of text that repeats the end of previous (splitter overlap)."""
+        longest = min(len(previous), len(text), MAX_OVERLAP_CHARS)
+        for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+            if previous.endswith(text[:size]):
+                return text[size:].lstrip()
+        return text
+
+    def select(self, results: List[Dict[str, Any]], model: str) -> List[Tuple[Dict[str, Any], str]]:
+        """Pick (chunk, text) pairs in relevance order within the model's token budget."""
+        budget = self.token_budget(model)
+        used = 0
+        selected: List[Tuple[Dict[str, Any], str]] = []
+        seen_shingles: List[set] = []
+        for chunk in results:
+            text = " ".join(chunk.get("content", "").split())
+            for previous, previous_text in selected:
+                if (previous.get("source"), previous.get("page_num")) == (chunk.get("source"), chunk.get("page_num")):
+                    text = self.trim_overlap(previous_text, text)
+            if not text:
+                continue
+
+            shingles = self.shingles(text)
+            if any(
+                len(shingles & other) / max(len(shingles | other), 1) >= NEAR_DUPLICATE_THRESHOLD
+                or shingles <= other
+                for other in seen_shingles
+            ):
+                continue
+
+            cost = self.estimate_tokens(self.label(chunk)) + self.estimate_tokens(text)
+            if used + cost > budget:
+                # A smaller, less relevant chunk may still fit
+                continue
+            used += cost
+            selected.append((chunk, text))
+            seen_shingles.append(shingles)
+        return selected
+
+    def build(self, results: List[Dict[str, Any]], model: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Return the labelled context string and the chunks it contains."""
+        selected = self.select(results, model)
+        context = "\n\n".join(f"{self.label(chunk)} {text}" for chunk, text in selected)
+        return context, [chunk for chunk, _ in selected]
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+class DocumentCatalog:
+    """The files under a set of directories, listed once and shared by all sessions.
+
+    A directory's mtime changes whenever a file is added, removed or renamed
+    in it, so the catalog re-lists only the directories whose mtime moved.
+    The mtimes themselves are checked at most every check_interval seconds,
+    so most reruns touch the filesystem not at all.
+    """
+
+    def __init__(self, dirs: List[str], check_interval: float = 2.0):
+        self.dirs = dirs
+        self.check_interval = check_interval
+        self._listings: dict = {}
+        self._mtimes: dict = {}
+        self._documents: List[Tuple[str, str]] = []
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _mtime(directory: str) -> Optional[float]:
+        try:
+            return os.stat(directory).st_mtime
+        except OSError:
+            return None
+
+    @staticmethod
+    def _list(directory: str) -> List[Tuple[str, str]]:
+        try:
+            with os.scandir(directory) as entries:
+                return sorted((entry.name, entry.path) for entry in entries if entry.is_file())
+        except OSError as e:
+            print(f"Error listing {directory}: {str(e)}")
+            return []
+
+    def documents(self) -> List[Tuple[str, str]]:
+        """(file name, path) of every file, in directory order."""
+        if time.monotonic() - self._checked < self.check_interval:
+            return self._documents
+        # Sessions share the catalog; only one of them re-checks
+        with self._lock:
+            if time.monotonic() - self._checked >= self.check_interval:
+                changed = False
+                for directory in self.dirs:
+                    mtime = self._mtime(directory)
+                    if directory not in self._mtimes or mtime != self._mtimes[directory]:
+                        self._listings[directory] = self._list(directory) if mtime is not None else []
+                        self._mtimes[directory] = mtime
+                        changed = True
+                if changed:
+                    self._documents = [doc for directory in self.dirs for doc in self._listings[directory]]
+                self._checked = time.monotonic()
+        return self._documents
@@ -0,0 +1,179 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pdfplumber
+import pandas as pd
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# --- CONFIG ---
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Worker processes used to parse files in parallel (1 parses in-process)
+PARSE_WORKERS = os.cpu_count() or 1
+# PDFs with more pages than this are split into page ranges across workers
+PDF_PAGES_PER_TASK = 8
+# Parse tasks submitted ahead per worker; bounds parsed chunks waiting to be indexed
+PARSE_MAX_PENDING = 2
+
+# --- INIT ---
+splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def iter_pdf_pages(file_path, start=0, end=None):
+    """Yield the chunks of each page in [start, end) of a PDF, one page at a time."""
+    with pdfplumber.open(file_path) as pdf:
+        for i in range(start, len(pdf.pages) if end is None else min(end, len(pdf.pages))):
+            page = pdf.pages[i]
+            text = page.extract_text() or ""
+            if text.strip():
+                yield [
+                    {
+                        "content": chunk,
+                        "source": os.path.basename(file_path),
+                        "page_num": i + 1,
+                        "metadata": {}
+                    }
+                    for chunk in splitter.split_text(text)
+                ]
+            # pdfplumber keeps parsed page objects alive on the document otherwise
+            page.flush_cache()
+
+def process_pdf_pages(file_path, start=0, end=None):
+    """Chunk the pages [start, end) of a PDF."""
+    return [doc for docs in iter_pdf_pages(file_path, start, end) for doc in docs]
+
+def process_pdf(file_path):
+    print(f"Processing PDF: {file_path}")
+    return process_pdf_pages(file_path)
+
+def serialize_rows(df):
+    """Join the non-empty cells of every row with " | ", one column at a time.
+
+    Works on whole columns instead of df.iterrows(), which builds a Series
+    per row (and turns ints into floats in all-numeric rows).
+    """
+    contents = np.full(len(df), "", dtype=object)
+    started = np.zeros(len(df), dtype=bool)
+    for column in df.columns:
+        values = df[column]
+        present = values.notna().to_numpy()
+        cells = values.astype(object).astype(str).to_numpy(dtype=object)
+        separators = np.where(started, " | ", "")
+        contents = np.where(present, contents + separators + cells, contents)
+        started |= present
+    return contents.tolist()
+
+def iter_excel_rows(file_path, rows_per_part=500):
+    """Yield the row chunks of a spreadsheet in parts of rows_per_part."""
+    df = pd.read_excel(file_path)
+    source = os.path.basename(file_path)
+    for start in range(0, len(df), rows_per_part):
+        part = df.iloc[start:start + rows_per_part]
+        yield [
+            {
+                "content": content,
+                "source": source,
+                "page_num": None,
+                "metadata": {"row": idx}
+            }
+            for idx, content in zip(part.index.tolist(), serialize_rows(part))
+        ]
+
+def process_excel(file_path):
+    print(f"Processing Excel: {file_path}")
+    return [doc for docs in iter_excel_rows(file_path) for doc in docs]
+
+def iter_file_parts(file_path):
+    """Yield a supported file's chunks in parts: a page of a PDF or a block of spreadsheet rows."""
+    if file_path.lower().endswith(".pdf"):
+        print(f"Processing PDF: {file_path}")
+        return iter_pdf_pages(file_path)
+    print(f"Processing Excel: {file_path}")
+    return iter_excel_rows(file_path)
+
+def _parse_task(file_path, start, end):
+    """Worker entry point: parse a whole PDF, or a page range of one."""
+    if start is None:
+        return process_pdf(file_path)
+    print(f"Processing PDF: {file_path} (pages {start + 1}-{end})")
+    return process_pdf_pages(file_path, start, end)
+
+def _split_tasks(file_path):
+    """Split a PDF into (start, end) page ranges; (None, None) means the whole file."""
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+    except Exception as e:
+        print(f"Error counting pages of {file_path}: {str(e)}")
+        return [(None, None)]
+    if page_count <= PDF_PAGES_PER_TASK:
+        return [(None, None)]
+    return [
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+
+def _iter_file_in_process(file_path):
+    """Parse one file in this process, yielding (file_path, docs, last) part by part."""
+    try:
+        for docs in iter_file_parts(file_path):
+            yield file_path, docs, False
+    except Exception as e:
+        print(f"Error parsing {file_path}: {str(e)}")
+        yield file_path, None, True
+    else:
+        yield file_path, [], True
+
+def iter_parsed_parts(file_paths, workers=PARSE_WORKERS):
+    """Yield (file_path, docs, last) for each part of each file, in input order.
+
+    Parts are pages of PDFs and blocks of spreadsheet rows when parsing
+    in-process. In a process pool, PDFs are parsed in page ranges of at most
+    PDF_PAGES_PER_TASK pages; spreadsheets are still streamed in row blocks
+    in this process, since a worker would have to return the whole sheet at
+    once (and every row-range task would re-read the workbook). last is True
+    on the final part of a file. docs is None (with last=True) if the file
+    could not be parsed; the parts already yielded for it should then be
+    discarded.
+
+    The pool keeps at most PARSE_MAX_PENDING tasks per worker in flight, so
+    parsed but unconsumed chunks never pile up in memory.
+    """
+    if workers <= 1:
+        for file_path in file_paths:
+            yield from _iter_file_in_process(file_path)
+        return
+
+    failed = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            if not file_path.lower().endswith(".pdf"):
+                # Keep the output in input order: finish the PDFs queued before it first
+                while pending:
+                    yield from _finish_task(pending.popleft(), failed)
+                yield from _iter_file_in_process(file_path)
+                continue
+            ranges = _split_tasks(file_path)
+            for i, (start, end) in enumerate(ranges):
+                pending.append((file_path, i == len(ranges) - 1, executor.submit(_parse_task, file_path, start, end)))
+                while len(pending) >= workers * PARSE_MAX_PENDING:
+                    yield from _finish_task(pending.popleft(), failed)
+        while pending:
+            yield from _finish_task(pending.popleft(), failed)
+
+def _finish_task(task, failed):
+    file_path, last, future = task
+    if file_path in failed:
+        # Parts after a failed one are dropped; the failure was already reported
+        future.cancel()
+        return
+    try:
+        docs = future.result()
+    except Exception as e:
+        print(f"Error parsing {file_path}: {str(e)}")
+        failed.add(file_path)
+        yield file_path, None, True
+        return
+    yield file_path, docs, last
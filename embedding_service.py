@@ -1,50 +1,260 @@
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
 import streamlit as st
-from sentence_transformers import SentenceTransformer
-from supabase import create_client, Client
-from typing import List, Dict, Any
-from config import SUPABASE_URL, SUPABASE_KEY, EMBEDDING_MODEL, TOP_K_RESULTS
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    EMBEDDING_MODEL,
+    TOP_K_RESULTS,
+    RETRIEVAL_BACKEND,
+    LOCAL_INDEX_DIR,
+    VECTOR_SEARCH,
+    IVF_PROBES,
+    HYBRID_SEARCH,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    COMPARISON_MAX_ENTITIES,
+    COMPARISON_RESULTS_PER_ENTITY,
+    SPEC_TABLE_ENABLED,
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RERANK_CANDIDATES,
+    RERANK_CACHE_SIZE,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+    QUERY_BATCH_WINDOW_MS,
+    QUERY_BATCH_MAX,
+    LOAD_RETRY_INTERVAL
+)
+from vector_store import SupabaseVectorStore, LocalVectorStore
+from cache_service import LRUCache
+from lexical_index import LexicalStore, reciprocal_rank_fusion, chunk_key
+from reranker import CrossEncoderReranker
+from query_encoder import BatchingEncoder
+from spec_table import SpecStore, SpecTable
+from metrics_service import metrics
 import os
 
+# Words that separate the products in a comparison query
+COMPARISON_SPLIT_RE = re.compile(r"\s*(?:\bvs\b\.?|\bversus\b|\band\b|\bwith\b|,|/)\s*", re.IGNORECASE)
+COMPARISON_ARTICLE_RE = re.compile(r"^(?:the|a|an)\s+", re.IGNORECASE)
+COMPARISON_LEAD_RE = re.compile(r"^.*?\b(?:compare|comparison\s+(?:of|between)|differences?\s+between)\s+(?:the\s+)?", re.IGNORECASE)
+
+def load_in_background(load: Callable[[], Any]) -> Future:
+    """Run load in a background worker thread so the page can render meanwhile."""
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+    future = executor.submit(load)
+    future.add_done_callback(report_load_error)
+    executor.shutdown(wait=False)
+    return future
+
+def report_load_error(future: Future):
+    # Runs once per load, so a failed load is reported once rather than on every use
+    if future.exception() is not None:
+        print(f"Error loading in background: {str(future.exception())}")
+
+class BackgroundLoader:
+    """A load running in the background, started again on use after it failed.
+
+    A failure is kept for LOAD_RETRY_INTERVAL seconds, so a model that cannot
+    load is not reloaded by every query.
+    """
+
+    def __init__(self, load: Callable[[], Any]):
+        self._load = load
+        self._lock = threading.Lock()
+        self._future = load_in_background(load)
+        self._failed_at = None
+
+    def future(self) -> Future:
+        """The current load; a failed one is replaced by a new attempt once the retry interval has passed."""
+        with self._lock:
+            future = self._future
+            if future.done() and future.exception() is not None:
+                if self._failed_at is None:
+                    self._failed_at = time.monotonic()
+                elif time.monotonic() - self._failed_at >= LOAD_RETRY_INTERVAL:
+                    self._future = future = load_in_background(self._load)
+                    self._failed_at = None
+            return future
+
+    def result(self) -> Any:
+        """The loaded object; blocks until the load finishes and raises if it failed."""
+        return self.future().result()
+
+    def ready(self) -> bool:
+        """Whether the load has finished successfully."""
+        future = self.future()
+        return future.done() and future.exception() is None
+
+def load_embedder():
+    """Import sentence_transformers, load the model and run one warm-up encode."""
+    start = time.perf_counter()
+    # torch and sentence_transformers take seconds to import; keep them off the page render
+    from sentence_transformers import SentenceTransformer
+    imported = time.perf_counter()
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    loaded = time.perf_counter()
+    model.encode(["scanner warm-up"])
+    metrics.record_startup("embedding_import", imported - start)
+    metrics.record_startup("embedding_load", loaded - imported)
+    metrics.record_startup("embedding_warmup", time.perf_counter() - loaded)
+    return model
+
+def load_vector_store():
+    """Create the configured retrieval backend (and its Supabase client)."""
+    start = time.perf_counter()
+    if RETRIEVAL_BACKEND == "local":
+        store = LocalVectorStore(LOCAL_INDEX_DIR, IVF_PROBES if VECTOR_SEARCH == "ivf" else 0)
+    else:
+        from supabase import create_client, Client
+        client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        store = SupabaseVectorStore(client)
+    metrics.record_startup("vector_store", time.perf_counter() - start)
+    return store
+
+def load_reranker() -> CrossEncoderReranker:
+    from sentence_transformers import CrossEncoder
+    return CrossEncoderReranker(CrossEncoder(RERANK_MODEL), LRUCache(RERANK_CACHE_SIZE))
+
+@st.cache_resource
+def get_embedder_loader() -> BackgroundLoader:
+    """Process-wide embedding model, loading in the background from the first page view."""
+    return BackgroundLoader(load_embedder)
+
+@st.cache_resource
+def get_vector_store_loader() -> BackgroundLoader:
+    """Process-wide retrieval backend, created in the background and shared by all sessions."""
+    return BackgroundLoader(load_vector_store)
+
+@st.cache_resource
+def get_reranker_loader() -> BackgroundLoader:
+    """Process-wide cross-encoder reranker and its pair-score cache, loaded in the background."""
+    return BackgroundLoader(load_reranker)
+
+def get_embedder():
+    """The shared embedding model; blocks until the background load has finished."""
+    return get_embedder_loader().result()
+
+@st.cache_resource
+def get_lexical_store() -> LexicalStore:
+    """Process-wide BM25 keyword index, shared by all sessions."""
+    return LexicalStore(LOCAL_INDEX_DIR)
+
+@st.cache_resource
+def get_spec_store() -> SpecStore:
+    """Process-wide product spec table, shared by all sessions."""
+    return SpecStore(LOCAL_INDEX_DIR)
+
+@st.cache_resource
+def get_query_encoder() -> BatchingEncoder:
+    """Process-wide encoder that batches the queries of concurrent sessions."""
+    return BatchingEncoder(get_embedder_loader().result, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX)
+
+@st.cache_resource
+def get_query_cache() -> LRUCache:
+    """Process-wide query embedding cache, shared by all sessions."""
+    return LRUCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+
 class EmbeddingService:
     def __init__(self):
-        # Lazy-load the embedding model
-        if 'embedder' not in st.session_state:
-            with st.spinner('Loading embedding model...'):
-                st.session_state.embedder = SentenceTransformer(EMBEDDING_MODEL)
-        
-        # Initialize Supabase client once
-        if 'supabase_client' not in st.session_state:
-            st.session_state.supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        self.embedder = st.session_state.embedder
-        self.supabase: Client = st.session_state.supabase_client
+        # Models and clients load in background threads; the first use waits for them
+        self._embedder_loader = get_embedder_loader()
+        self._vector_store_loader = get_vector_store_loader()
+        self._reranker_loader = get_reranker_loader() if RERANK_ENABLED else None
+        self.lexical_store = get_lexical_store() if HYBRID_SEARCH else None
+        self.spec_store = get_spec_store() if SPEC_TABLE_ENABLED else None
+        self.query_cache = get_query_cache()
+        self.query_encoder = get_query_encoder()
+
+    @property
+    def vector_store(self):
+        return self._vector_store_loader.result()
 
-    def embed_query(self, query: str) -> List[float]:
+    @property
+    def reranker(self) -> Optional[CrossEncoderReranker]:
+        """The shared reranker, or None if reranking is disabled or the model failed to load."""
+        if self._reranker_loader is None:
+            return None
+        try:
+            return self._reranker_loader.result()
+        except Exception:
+            # report_load_error logged the failure once; queries are served without reranking
+            return None
+
+    def is_ready(self) -> bool:
+        """Whether the background loads have finished without error; a failed load is retried."""
+        loaders = [self._embedder_loader, self._vector_store_loader, self._reranker_loader]
+        return all(loader.ready() for loader in loaders if loader is not None)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Cache key for a query: lowercased with whitespace collapsed.
+
+        all-MiniLM-L6-v2 uses an uncased tokenizer, so this does not change
+        the embedding.
+        """
+        return " ".join(query.lower().split())
+
+    def embed_query(self, query: str) -> np.ndarray:
         """Generate embeddings for a query."""
-        # Cache query embeddings to avoid recomputing
-        cache_key = f"embed_{query}"
-        if cache_key in st.session_state:
-            return st.session_state[cache_key]
+        # Cache query embeddings across sessions to avoid recomputing
+        cache_key = self.normalize_query(query)
+        embedding = self.query_cache.get(cache_key)
+        if embedding is not None:
+            return embedding
             
-        embedding = self.embedder.encode([query])[0].tolist()
-        st.session_state[cache_key] = embedding
+        embedding = self.query_encoder.encode(query)
+        self.query_cache.set(cache_key, embedding)
         return embedding
 
-    def search_documents(self, query_embedding: List[float], top_k: int = TOP_K_RESULTS) -> List[Dict[str, Any]]:
-        """Search for relevant documents using vector similarity."""
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the query embedding cache."""
+        return self.query_cache.stats()
+
+    def encoder_stats(self) -> Dict[str, Any]:
+        """Batch sizes and queue waits of the shared query encoder."""
+        return self.query_encoder.stats()
+
+    def search_documents(self, query_embedding: np.ndarray, top_k: int = TOP_K_RESULTS,
+                         query: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents using vector similarity.
+
+        When hybrid search is enabled and the query text is given, vector and
+        BM25 keyword results are merged with reciprocal-rank fusion. With
+        reranking enabled, RERANK_CANDIDATES are fetched and the cross-encoder
+        picks the top_k; if the reranker failed to load, first-stage results
+        are returned as they are.
+        """
         try:
-            response = self.supabase.rpc(
-                "match_documents",
-                {"query_embedding": query_embedding, "match_count": top_k}
-            ).execute()
-            
-            if hasattr(response, 'data'):
-                return response.data
-            return []
+            reranker = self.reranker
+            if reranker is None or not query:
+                return self.retrieve(query_embedding, top_k, query)
+            candidates = self.retrieve(query_embedding, max(top_k, RERANK_CANDIDATES), query)
+            return reranker.rerank(query, candidates, top_k)
         except Exception as e:
             print(f"Error searching documents: {str(e)}")
             return []
 
+    def retrieve(self, query_embedding: np.ndarray, top_k: int, query: Optional[str] = None) -> List[Dict[str, Any]]:
+        """First-stage retrieval: vector search, fused with BM25 when available."""
+        if self.lexical_store is None or not query:
+            return self.vector_store.search(query_embedding, top_k)
+        candidates = max(top_k, HYBRID_CANDIDATES)
+        vector_results = self.vector_store.search(query_embedding, candidates)
+        keyword_results = self.lexical_store.search(query, candidates)
+        return reciprocal_rank_fusion([vector_results, keyword_results], top_k, RRF_K)
+
+    def rerank_stats(self) -> Optional[Dict[str, Any]]:
+        """Reranker latency and cache counters, or None if reranking is disabled or still loading."""
+        if self._reranker_loader is None or not self._reranker_loader.ready():
+            return None
+        return self.reranker.stats()
+
     def format_sources(self, sources: List[Dict[str, Any]]) -> str:
         """Format the sources for display."""
         if not sources:
@@ -56,4 +266,70 @@ class EmbeddingService:
     def is_comparison_query(query: str) -> bool:
         """Check if the query is asking for a comparison."""
         q = query.lower()
-        return any(word in q for word in ["compare", "comparison", "vs", "versus"]) 
\ No newline at end of file
+        return any(word in q for word in ["compare", "comparison", "vs", "versus"]) 
+
+    @staticmethod
+    def split_comparison_entities(query: str) -> List[str]:
+        """Split a comparison query into the products being compared.
+
+        "Canon 120 vs 208" becomes ["Canon 120", "Canon 208"]: an entity that
+        is only a model number inherits the brand word of the first entity.
+        Leading articles are dropped, and when some entities name a model
+        number the ones that do not are qualifiers, not products, and are
+        dropped too: "Compare CR-120 with P-208" gives ["CR-120", "P-208"],
+        while "the DR-C225 with UV and the CR-120" gives ["DR-C225", "CR-120"].
+        """
+        text = COMPARISON_LEAD_RE.sub("", query.strip().rstrip("?.!"))
+        entities = [COMPARISON_ARTICLE_RE.sub("", part.strip()) for part in COMPARISON_SPLIT_RE.split(text) if part and part.strip()]
+        entities = [entity for entity in entities if entity]
+        models = [entity for entity in entities if any(c.isdigit() for c in entity)]
+        if models:
+            entities = models
+        if len(entities) < 2:
+            return entities
+        brand = entities[0].split()[0]
+        if any(c.isalpha() for c in brand) and not any(c.isdigit() for c in brand):
+            entities = [
+                entity if any(c.isalpha() for c in entity) else f"{brand} {entity}"
+                for entity in entities
+            ]
+        return entities[:COMPARISON_MAX_ENTITIES]
+
+    def comparison_specs(self, query: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Spec table context for a comparison whose products are all in the spec table.
+
+        Returns (context, sources) with one source record per spreadsheet, or
+        None when the query should go through retrieval instead.
+        """
+        if self.spec_store is None:
+            return None
+        products = self.spec_store.lookup(self.split_comparison_entities(query))
+        if products is None:
+            return None
+        sources = [{"source": source} for source in dict.fromkeys(product["source"] for product in products)]
+        return SpecTable.format(products), sources
+
+    def search_comparison(self, query: str, per_entity: int = COMPARISON_RESULTS_PER_ENTITY) -> List[Dict[str, Any]]:
+        """Retrieve for each compared product concurrently and merge the results evenly.
+
+        Falls back to a regular search when fewer than two products are found.
+        """
+        entities = self.split_comparison_entities(query)
+        if len(entities) < 2:
+            return self.search_documents(self.embed_query(query), query=query)
+        
+        def search_entity(entity: str) -> List[Dict[str, Any]]:
+            return self.search_documents(self.embed_query(entity), per_entity, query=entity)
+        
+        with ThreadPoolExecutor(max_workers=len(entities)) as executor:
+            per_entity_results = list(executor.map(search_entity, entities))
+        
+        # Interleave so every product is represented, skipping chunks already taken
+        merged = []
+        seen = set()
+        for rank in range(per_entity):
+            for entity, results in zip(entities, per_entity_results):
+                if rank < len(results) and chunk_key(results[rank]) not in seen:
+                    seen.add(chunk_key(results[rank]))
+                    merged.append(dict(results[rank], entity=entity))
+        return merged
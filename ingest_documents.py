@@ -1,9 +1,23 @@
 import os
-import pdfplumber
-import pandas as pd
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
 from supabase import create_client, Client
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
+from config import RETRIEVAL_BACKEND, LOCAL_INDEX_DIR, INDEX_PRECISION, IVF_MIN_CHUNKS, IVF_LISTS
+from vector_store import LocalVectorIndex, write_index_version
+from quantization import vector_literal
+from lexical_index import BM25Index
+from spec_table import SpecTable
+from document_parser import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    PARSE_WORKERS,
+    iter_parsed_parts
+)
 
 # --- CONFIG ---
 SUPABASE_URL = "https://szsxuszodpflthkclrck.supabase.co"
@@ -16,65 +30,232 @@ INPUT_DIRS = [
     os.path.join("Input documents", "Brochures")
 ]
 
+# Chunks per SentenceTransformer.encode forward pass
+EMBED_BATCH_SIZE = 64
+# Rows per multi-row insert into the documents table
+UPLOAD_BATCH_SIZE = 100
+# Attempts per upload batch before giving up on it
+UPLOAD_MAX_RETRIES = 3
+# Batches buffered between the parse, embed and upload stages of the pipeline
+PIPELINE_QUEUE_SIZE = 4
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Content hash and chunking parameters of every ingested file, keyed by source
+MANIFEST_PATH = "ingest_manifest.json"
+
+# The local index is always written; Supabase only when it is the retrieval backend
+UPLOAD_TO_SUPABASE = RETRIEVAL_BACKEND == "supabase"
+
 # --- INIT ---
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-
-def process_pdf(file_path):
-    print(f"Processing PDF: {file_path}")
-    docs = []
-    with pdfplumber.open(file_path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            text = page.extract_text() or ""
-            if text.strip():
-                for chunk in splitter.split_text(text):
-                    docs.append({
-                        "content": chunk,
-                        "source": os.path.basename(file_path),
-                        "page_num": i + 1,
-                        "metadata": {}
-                    })
-    return docs
-
-def process_excel(file_path):
-    print(f"Processing Excel: {file_path}")
-    docs = []
-    df = pd.read_excel(file_path)
-    for idx, row in df.iterrows():
-        content = " | ".join([str(cell) for cell in row.values if pd.notnull(cell)])
-        docs.append({
-            "content": content,
-            "source": os.path.basename(file_path),
-            "page_num": None,
-            "metadata": {"row": idx}
-        })
-    return docs
-
-def embed_and_upload(docs):
-    if not docs:
-        return
-        
-    print(f"Embedding and uploading {len(docs)} document chunks...")
-    for i, doc in enumerate(docs):
-        if i % 10 == 0:  # Progress indicator every 10 chunks
-            print(f"Processing chunk {i+1}/{len(docs)}")
-            
+# Created in init_clients() rather than at import, so parser worker processes
+# that re-import this module do not each load the embedding model.
+supabase: Client = None
+embedder = None
+
+def init_clients():
+    """Create the Supabase client and load the embedding model."""
+    global supabase, embedder
+    if supabase is None and UPLOAD_TO_SUPABASE:
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    if embedder is None:
+        embedder = SentenceTransformer(EMBEDDING_MODEL)
+
+def upload_rows(rows):
+    """Insert a batch of rows in one request, retrying the whole batch on failure."""
+    for attempt in range(1, UPLOAD_MAX_RETRIES + 1):
         try:
-            # Since we're clearing the database first, no need to check for existing documents
-            embedding = embedder.encode(doc["content"]).tolist()
-            data = {
+            supabase.table("documents").insert(rows).execute()
+            return True
+        except Exception as e:
+            print(f"Error uploading batch of {len(rows)} chunks (attempt {attempt}/{UPLOAD_MAX_RETRIES}): {str(e)}")
+            if attempt < UPLOAD_MAX_RETRIES:
+                time.sleep(2 ** (attempt - 1))
+    return False
+
+def embed_docs(docs):
+    """Encode chunk contents in batches. Returns one embedding row per chunk."""
+    return embedder.encode(
+        [doc["content"] for doc in docs],
+        batch_size=EMBED_BATCH_SIZE,
+        convert_to_numpy=True
+    )
+
+def upload_docs(docs, embeddings):
+    """Upload embedded chunks with bulk inserts. Returns the number of chunks uploaded."""
+    uploaded = 0
+    for i in range(0, len(docs), UPLOAD_BATCH_SIZE):
+        batch = docs[i:i + UPLOAD_BATCH_SIZE]
+        print(f"Uploading chunks {i+1}-{i+len(batch)}/{len(docs)}")
+        rows = [
+            {
                 "content": doc["content"],
-                "embedding": embedding,
+                "embedding": vector_literal(embedding),
                 "source": doc["source"],
                 "page_num": doc["page_num"],
                 "metadata": doc["metadata"]
             }
-            supabase.table("documents").insert(data).execute()
-        except Exception as e:
-            print(f"Error uploading document chunk: {str(e)}")
-    
-    print(f"Successfully uploaded {len(docs)} document chunks.")
+            for doc, embedding in zip(batch, embeddings[i:i + UPLOAD_BATCH_SIZE])
+        ]
+        if upload_rows(rows):
+            uploaded += len(rows)
+    return uploaded
+
+def put_or_stop(out, item, stop):
+    """Put item on a bounded queue, giving up once the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def get_or_stop(inp, stop):
+    """Take the next item from a bounded queue, or None once the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            return inp.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+def parse_stage(file_paths, workers, out, stop):
+    """Pipeline stage 1: parse files into batches of UPLOAD_BATCH_SIZE chunks.
+
+    Emits ("chunks", path, docs), ("failed", path, None) and, once per file,
+    ("end", path, None), then a final None.
+    """
+    try:
+        batch = []
+        for fpath, docs, last in iter_parsed_parts(file_paths, workers):
+            if stop.is_set():
+                return
+            if docs is None:
+                batch = []
+                put_or_stop(out, ("failed", fpath, None), stop)
+            else:
+                for doc in docs:
+                    batch.append(doc)
+                    if len(batch) == UPLOAD_BATCH_SIZE:
+                        put_or_stop(out, ("chunks", fpath, batch), stop)
+                        batch = []
+            if last:
+                if batch:
+                    put_or_stop(out, ("chunks", fpath, batch), stop)
+                    batch = []
+                put_or_stop(out, ("end", fpath, None), stop)
+    except Exception as e:
+        put_or_stop(out, ("error", None, e), stop)
+    finally:
+        put_or_stop(out, None, stop)
+
+def embed_stage(inp, out, stop):
+    """Pipeline stage 2: attach embeddings to each batch of chunks."""
+    while not stop.is_set():
+        item = get_or_stop(inp, stop)
+        if item is not None and item[0] == "chunks":
+            kind, fpath, docs = item
+            try:
+                item = (kind, fpath, (docs, embed_docs(docs)))
+            except Exception as e:
+                print(f"Error embedding chunks of {fpath}: {str(e)}")
+                item = ("failed", fpath, None)
+        put_or_stop(out, item, stop)
+        if item is None:
+            return
+
+def iter_embedded_batches(file_paths, workers):
+    """Parse and embed in background threads connected by bounded queues.
+
+    Yields the items of parse_stage, with (docs, embeddings) as the payload
+    of "chunks" items. At most PIPELINE_QUEUE_SIZE batches wait between two
+    stages, so memory stays flat however large the files are, while parsing,
+    encoding and the caller's uploads overlap.
+    """
+    parsed = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    embedded = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=parse_stage, args=(file_paths, workers, parsed, stop), daemon=True),
+        threading.Thread(target=embed_stage, args=(parsed, embedded, stop), daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = embedded.get()
+            if item is None:
+                return
+            if item[0] == "error":
+                raise item[2]
+            yield item
+    finally:
+        stop.set()
+
+def index_files(paths, local_index, workers, replace=False):
+    """Pipeline stage 3: store embedded batches in the local index and, if enabled, Supabase.
+
+    paths maps file paths to sources. Yields (path, chunks indexed) once a
+    file is complete, or (path, None) if it failed; a failed file's new rows
+    are removed again and its previous version is kept. With replace=True the
+    previous chunks of each source are swapped out only after all of its new
+    chunks were stored, so the source is never missing from the index.
+    """
+    files = {}
+    for kind, fpath, payload in iter_embedded_batches(list(paths), workers):
+        source = paths[fpath]
+        state = files.get(fpath)
+        if state is None:
+            print(f"Indexing file: {source}")
+            state = files[fpath] = {
+                "ok": True,
+                "chunks": 0,
+                "uploaded": False,
+                "start": time.perf_counter(),
+                # Row ids only grow, so rows up to these ids are the previous version
+                "old_max_id": None,
+                "old_local_id": local_index.next_id - 1
+            }
+            if replace and UPLOAD_TO_SUPABASE:
+                try:
+                    state["old_max_id"] = max_document_id(source)
+                except Exception as e:
+                    print(f"Error reading current rows of {source}: {str(e)}")
+                    state["ok"] = False
+        if kind == "failed":
+            state["ok"] = False
+        elif kind == "chunks" and state["ok"]:
+            docs, embeddings = payload
+            if UPLOAD_TO_SUPABASE:
+                state["uploaded"] = True
+                if upload_docs(docs, embeddings) < len(docs):
+                    state["ok"] = False
+            local_index.add(docs, embeddings)
+            state["chunks"] += len(docs)
+        elif kind == "end":
+            del files[fpath]
+            try:
+                yield fpath, finish_file(source, state, local_index, replace)
+            except Exception as e:
+                print(f"Error indexing {source}: {str(e)}")
+                yield fpath, None
+
+def finish_file(source, state, local_index, replace):
+    """Commit or roll back the rows a file added. Returns the chunk count, or None on failure."""
+    if not state["ok"]:
+        print(f"Indexing of {source} incomplete, keeping previous version.")
+        local_index.remove_source(source, after_id=state["old_local_id"])
+        if state["uploaded"]:
+            delete_source_documents(source, after_id=state["old_max_id"])
+        return None
+    if replace:
+        if UPLOAD_TO_SUPABASE and state["old_max_id"] is not None:
+            delete_source_documents(source, up_to_id=state["old_max_id"])
+        local_index.remove_source(source, up_to_id=state["old_local_id"])
+    elapsed = time.perf_counter() - state["start"]
+    rate = state["chunks"] / elapsed if elapsed > 0 else 0.0
+    print(f"Successfully indexed {state['chunks']} document chunks in {elapsed:.1f}s ({rate:.1f} chunks/sec).")
+    return state["chunks"]
 
 def clear_supabase_documents():
     """Clear all documents from the Supabase documents table."""
@@ -86,35 +267,191 @@ def clear_supabase_documents():
     except Exception as e:
         print(f"Error clearing documents from Supabase: {str(e)}")
 
-def main():
-    # Clear existing documents before ingesting new ones
-    clear_supabase_documents()
-    
-    # Process each document in the input directories
+def load_manifest():
+    """Load the ingest manifest, or an empty one if it does not exist yet."""
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading manifest {MANIFEST_PATH}, treating all files as new: {str(e)}")
+        return {}
+
+def save_manifest(manifest):
+    """Write the manifest atomically so an interrupted run never leaves it half-written."""
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def save_index(local_index, manifest, files):
+    """Persist the local vector, IVF and BM25 indexes, the spec table and the manifest, then publish the new index version.
+
+    The version is a hash of the manifest, so it only changes when the set of
+    ingested files or their contents change. Caches keyed on it (such as the
+    LLM response cache) are invalidated by a re-ingest that changed anything.
+    """
+    local_index.update_ivf(IVF_MIN_CHUNKS, IVF_LISTS)
+    local_index.save(LOCAL_INDEX_DIR)
+    BM25Index.build(local_index.chunks).save(LOCAL_INDEX_DIR)
+    # Rebuilt from every indexed spreadsheet; they are small compared to the PDFs
+    spreadsheets = [fpath for source, fpath in files if source in manifest and fpath.lower().endswith(".xlsx")]
+    SpecTable.build(spreadsheets).save(LOCAL_INDEX_DIR)
+    save_manifest(manifest)
+    version = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+    write_index_version(LOCAL_INDEX_DIR, version)
+
+def file_hash(file_path):
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunking_params():
+    """Parameters that change the produced chunks; a change forces re-ingestion."""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": EMBEDDING_MODEL,
+        "supabase": UPLOAD_TO_SUPABASE
+    }
+
+def list_input_files():
+    """Return (source, path) for every supported file under INPUT_DIRS."""
+    files = []
     for input_dir in INPUT_DIRS:
         if not os.path.exists(input_dir):
             print(f"Warning: Directory {input_dir} does not exist. Skipping.")
             continue
             
-        for fname in os.listdir(input_dir):
+        for fname in sorted(os.listdir(input_dir)):
             fpath = os.path.join(input_dir, fname)
-            if os.path.isfile(fpath):
-                print(f"Processing file: {fname}")
-                if fname.lower().endswith(".pdf"):
-                    docs = process_pdf(fpath)
-                    embed_and_upload(docs)
-                elif fname.lower().endswith(".xlsx"):
-                    docs = process_excel(fpath)
-                    embed_and_upload(docs)
-                else:
-                    print(f"Skipping unsupported file format: {fname}")
-            else:
+            if not os.path.isfile(fpath):
                 print(f"Skipping non-file: {fname}")
+            elif fname.lower().endswith((".pdf", ".xlsx")):
+                files.append((fname, fpath))
+            else:
+                print(f"Skipping unsupported file format: {fname}")
+    return files
+
+def max_document_id(source):
+    """Highest row id currently stored for a source, or None if it has no rows."""
+    response = (
+        supabase.table("documents")
+        .select("id")
+        .eq("source", source)
+        .order("id", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data[0]["id"] if response.data else None
+
+def delete_source_documents(source, up_to_id=None, after_id=None):
+    """Delete the rows of a source, optionally restricted to an id range."""
+    query = supabase.table("documents").delete().eq("source", source)
+    if up_to_id is not None:
+        query = query.lte("id", up_to_id)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    query.execute()
+
+def ingest_full(files, workers=PARSE_WORKERS):
+    """Clear the index and re-ingest every file."""
+    if UPLOAD_TO_SUPABASE:
+        clear_supabase_documents()
+    local_index = LocalVectorIndex.empty(precision=INDEX_PRECISION)
+    manifest = {}
+    total_uploaded = 0
+    paths = {fpath: source for source, fpath in files}
+    try:
+        for fpath, uploaded in index_files(paths, local_index, workers):
+            if uploaded is None:
+                continue
+            total_uploaded += uploaded
+            manifest[paths[fpath]] = {"hash": file_hash(fpath), "params": chunking_params(), "chunks": uploaded}
+    finally:
+        save_index(local_index, manifest, files)
+    return total_uploaded
+
+def ingest_incremental(files, workers=PARSE_WORKERS):
+    """Re-ingest only files that were added or changed and drop removed ones."""
+    manifest = load_manifest()
+    params = chunking_params()
+    # The manifest is only trusted if the local index it describes is present
+    if manifest and not LocalVectorIndex.exists(LOCAL_INDEX_DIR):
+        print(f"Local index {LOCAL_INDEX_DIR} is missing, re-indexing all files.")
+        manifest = {}
+    local_index = LocalVectorIndex.load(LOCAL_INDEX_DIR, mmap=False).with_precision(INDEX_PRECISION)
+    total_uploaded = 0
     
+    try:
+        current_sources = {source for source, _ in files}
+        for source in sorted(set(manifest) - current_sources):
+            print(f"Removing documents for deleted file: {source}")
+            try:
+                if UPLOAD_TO_SUPABASE:
+                    delete_source_documents(source)
+                local_index.remove_source(source)
+                del manifest[source]
+            except Exception as e:
+                print(f"Error removing documents for {source}: {str(e)}")
+        
+        changed = {}
+        digests = {}
+        for source, fpath in files:
+            digest = file_hash(fpath)
+            entry = manifest.get(source)
+            if entry and entry.get("hash") == digest and entry.get("params") == params:
+                print(f"Unchanged, skipping: {source}")
+                continue
+            print(f"{'Changed' if entry else 'New'} file: {source}")
+            changed[fpath] = source
+            digests[fpath] = digest
+        
+        for fpath, uploaded in index_files(changed, local_index, workers, replace=True):
+            if uploaded is None:
+                continue
+            total_uploaded += uploaded
+            manifest[changed[fpath]] = {"hash": digests[fpath], "params": params, "chunks": uploaded}
+    finally:
+        # The local index and the manifest are always saved together
+        save_index(local_index, manifest, files)
+    
+    return total_uploaded
+
+def main(full=False, workers=PARSE_WORKERS):
+    init_clients()
+    start = time.perf_counter()
+    files = list_input_files()
+    if full:
+        total_uploaded = ingest_full(files, workers)
+    else:
+        total_uploaded = ingest_incremental(files, workers)
+    
+    elapsed = time.perf_counter() - start
+    rate = total_uploaded / elapsed if elapsed > 0 else 0.0
+    print(f"Ingested {total_uploaded} chunks in {elapsed:.1f}s ({rate:.1f} chunks/sec).")
     print("Document ingestion complete!")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest scanner documents into the vector index.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Clear the documents table and re-ingest every file instead of only changed ones."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PARSE_WORKERS,
+        help=f"Parser processes for PDF/Excel files (default: {PARSE_WORKERS}, 1 disables the pool)."
+    )
+    args = parser.parse_args()
+    
     print("Starting document ingestion process...")
-    main()
+    main(full=args.full, workers=args.workers)
     print("Document ingestion process completed.")
-    print("You can now run the Streamlit app to query your documents.")
\ No newline at end of file
+    print("You can now run the Streamlit app to query your documents.")
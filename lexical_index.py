@@ -0,0 +1,157 @@
+import json
+import math
+import os
+import re
+import numpy as np
+from typing import List, Dict, Any, Tuple
+from vector_store import IndexFileWatcher
+
+# Words too common in support questions to carry any signal
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "the",
+    "to", "what", "which", "with"
+}
+
+# Runs of letters/digits, keeping separators inside model numbers ("cr-120", "fi-8170")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+SEPARATOR_RE = re.compile(r"[-_./]")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms for BM25.
+
+    Compound tokens such as "CR-120" produce the joined form ("cr120") and
+    the parts ("cr", "120"), so "CR120", "CR-120" and "CR 120" all match.
+    """
+    tokens = []
+    for match in TOKEN_RE.findall(text.lower()):
+        parts = SEPARATOR_RE.split(match)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+            tokens.extend(parts)
+        else:
+            tokens.append(match)
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over the same chunks as the vector index.
+
+    Persisted as a single `bm25.json` holding the chunk records, their token
+    counts and the postings, so it loads consistently on its own.
+    """
+
+    FILE = "bm25.json"
+
+    def __init__(self, chunks: List[Dict[str, Any]], doc_lengths: List[int],
+                 postings: Dict[str, Tuple[List[int], List[int]]], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(chunks) else 0.0
+        # term -> (row indices, term frequencies)
+        self.postings = {
+            term: (np.asarray(rows, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (rows, tfs) in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @classmethod
+    def empty(cls) -> "BM25Index":
+        return cls([], [], {})
+
+    @classmethod
+    def build(cls, chunks: List[Dict[str, Any]]) -> "BM25Index":
+        doc_lengths = []
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk["content"])
+            doc_lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                rows, tfs = postings.setdefault(token, ([], []))
+                rows.append(row)
+                tfs.append(tf)
+        return cls(list(chunks), doc_lengths, postings)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "BM25Index":
+        with open(os.path.join(index_dir, cls.FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["chunks"], data["doc_lengths"], data["postings"], data["k1"], data["b"])
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        path = os.path.join(index_dir, self.FILE)
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "chunks": self.chunks,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {
+                term: [rows.tolist(), tfs.astype(int).tolist()]
+                for term, (rows, tfs) in self.postings.items()
+            }
+        }
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """Return the top_k chunks by BM25 score, best first. Chunks without any query term are never returned."""
+        if not self.chunks or top_k <= 0:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        n_docs = len(self.chunks)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs = posting
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[rows] / max(self.avg_length, 1e-6))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if top_k < len(matched):
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+        return [dict(self.chunks[i], bm25_score=float(scores[i])) for i in ranked]
+
+
+class LexicalStore:
+    """Keyword retrieval over the BM25Index written by ingest_documents.py."""
+
+    def __init__(self, index_dir: str):
+        self._watcher = IndexFileWatcher(index_dir, BM25Index.FILE, BM25Index.load, BM25Index.empty())
+
+    @property
+    def index(self) -> BM25Index:
+        return self._watcher.get()
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        return self.index.search(query, top_k)
+
+
+def chunk_key(chunk: Dict[str, Any]) -> Tuple:
+    """Identity of a chunk that is the same in Supabase and the local index."""
+    return (chunk.get("source"), chunk.get("page_num"), chunk.get("content"))
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked result lists, scoring each chunk by sum(1 / (k + rank))."""
+    scores: Dict[Tuple, float] = {}
+    merged: Dict[Tuple, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, chunk in enumerate(results, start=1):
+            key = chunk_key(chunk)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            # Keep the first copy but collect every list's scores on it
+            merged[key] = dict(chunk, **merged.get(key, {}))
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)[:top_k]
+    return [dict(merged[key], rrf_score=scores[key]) for key in ranked]
@@ -1,8 +1,56 @@
 import requests
 import streamlit as st
 import hashlib
-from typing import Optional, Dict, Any
-from config import SYSTEM_PROMPT
+import json
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, Iterator
+from config import (
+    SYSTEM_PROMPT,
+    LLM_POOL_SIZE,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LOCAL_INDEX_DIR,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES
+)
+from cache_service import ResponseCache
+from metrics_service import metrics
+from vector_store import read_index_version
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """Process-wide handle on the disk-backed response cache."""
+    return ResponseCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+
+@st.cache_resource
+def get_http_session(provider: str) -> requests.Session:
+    """Process-wide keep-alive connection pool for one provider."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def filter_llm_output(text):
+    # Remove lines that look like reasoning or intro/summary statements
+    lines = text.split('\n')
+    filtered = []
+    for line in lines:
+        if re.match(r"^(Okay|Let me|Looking at|I should|So, |First,|Wait,|Based on|In summary|To answer|I don't see|Just the facts|I also need|I'll|\s*$)", line.strip()):
+            continue
+        filtered.append(line)
+    return '\n'.join(filtered).strip()
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 class LLMService:
     def __init__(self, provider: str, api_key: str, model: str):
@@ -10,44 +58,149 @@ class LLMService:
         self.api_key = api_key
         self.model = model
         self.base_url = "https://api.groq.com/openai/v1/chat/completions" if provider == "Groq" else "https://api.openai.com/v1/chat/completions"
+        self.cache = get_response_cache()
+        self.session = get_http_session(provider)
+        # False once a stream_response broke off before the end; the tokens
+        # it yielded (ending in an error message) must not be cached
+        self.stream_completed = True
+
+    @staticmethod
+    def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number `attempt` (0-based).
+
+        Honours a Retry-After header (seconds or HTTP date) when the server
+        sends one, and otherwise uses exponential backoff with full jitter.
+        """
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0.0), LLM_BACKOFF_MAX)
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    def post(self, payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """POST to the provider over the pooled session, retrying transient failures."""
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                response = self.session.post(
+                    self.base_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+                    stream=stream
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == LLM_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response
+                delay = self.backoff_delay(attempt, response.headers.get("Retry-After"))
+                response.close()
+            metrics.inc("llm_retries")
+            time.sleep(delay)
+
+    def build_payload(self, prompt: str) -> Dict[str, Any]:
+        """Chat completion request body for a prompt."""
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.2,
+            "max_tokens": 1024
+        }
+
+    def cache_key(self, payload: Dict[str, Any]) -> str:
+        """Hash of everything that determines the completion."""
+        return hashlib.sha256(
+            json.dumps([self.provider, payload], sort_keys=True).encode()
+        ).hexdigest()
 
     def generate_response(self, prompt: str) -> str:
         """Generate a response from the LLM."""
-        # Create a hash of the prompt and model to use as a cache key
-        cache_key = f"llm_response_{hashlib.md5((prompt + self.model).encode()).hexdigest()}"
+        payload = self.build_payload(prompt)
+        cache_key = self.cache_key(payload)
+        index_version = read_index_version(LOCAL_INDEX_DIR)
         
-        # Check if we have a cached response
-        if cache_key in st.session_state:
-            return st.session_state[cache_key]
+        # Check if we have a cached response for the current document index
+        cached = self.cache.get(cache_key, index_version)
+        if cached is not None:
+            return cached
             
         # If not cached, make the API call
         try:
             with st.spinner(f"Generating response with {self.provider}..."):
-                headers = {"Authorization": f"Bearer {self.api_key}"}
-                payload = {
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.2,
-                    "max_tokens": 1024
-                }
-                
-                # Use a timeout to prevent hanging on slow API calls
-                response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-                response.raise_for_status()
+                response = self.post(payload)
                 
                 result = response.json()["choices"][0]["message"]["content"]
                 
                 # Cache the result
-                st.session_state[cache_key] = result
+                self.cache.set(cache_key, result, index_version)
                 return result
         except requests.exceptions.RequestException as e:
             return f"[{self.provider} API Error] {str(e)}"
         except Exception as e:
             return f"[Error] {str(e)}"
 
+    def stream_response(self, prompt: str) -> Iterator[str]:
+        """Generate a response from the LLM, yielding tokens as they arrive.
+
+        Uses the OpenAI-compatible `stream: true` server-sent events protocol.
+        The full completion is stored in the same cache as generate_response,
+        and a cached response is yielded as a single chunk. If the request
+        fails, possibly after some tokens, an error message is yielded and
+        stream_completed is left False.
+        """
+        self.stream_completed = False
+        payload = self.build_payload(prompt)
+        cache_key = self.cache_key(payload)
+        index_version = read_index_version(LOCAL_INDEX_DIR)
+        
+        cached = self.cache.get(cache_key, index_version)
+        if cached is not None:
+            self.stream_completed = True
+            yield cached
+            return
+        
+        try:
+            parts = []
+            with self.post(dict(payload, stream=True), stream=True) as response:
+                for line in response.iter_lines():
+                    # SSE events look like "data: {...}"; skip keep-alives and comments
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip().decode("utf-8")
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    token = (choices[0].get("delta") or {}).get("content")
+                    if token:
+                        parts.append(token)
+                        yield token
+            
+            # Cache the complete result
+            self.cache.set(cache_key, "".join(parts), index_version)
+            self.stream_completed = True
+        except requests.exceptions.RequestException as e:
+            yield f"[{self.provider} API Error] {str(e)}"
+        except Exception as e:
+            yield f"[Error] {str(e)}"
+
+    @staticmethod
+    def is_error_response(text: str) -> bool:
+        """Whether generate_response returned an error message instead of an answer."""
+        return re.match(r"^\[(\w+ API )?Error\]", text) is not None
+
     @staticmethod
     def format_prompt(context: str, query: str, is_comparison: bool = False) -> str:
         """Format the prompt based on the query type."""
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from config import METRICS_WINDOW
+
+# Histogram bucket upper bounds in seconds, from cache hits to slow LLM calls
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "scanner_support"
+
+class Metrics:
+    """Process-wide latency spans, counters and gauges for the query pipeline.
+
+    Each stage keeps cumulative Prometheus histogram buckets plus a rolling
+    window of recent durations for percentiles. Collectors are callables
+    polled at export time, e.g. the stats() of the caches.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent: Dict[str, deque] = {}
+        self._buckets: Dict[str, list] = {}
+        self._sums: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._counters: Dict[str, float] = {}
+        self._collectors: Dict[str, Callable[[], Optional[Dict[str, Any]]]] = {}
+        self._startup: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            if stage not in self._recent:
+                self._recent[stage] = deque(maxlen=self.window)
+                self._buckets[stage] = [0] * len(BUCKETS)
+                self._sums[stage] = 0.0
+                self._counts[stage] = 0
+            self._recent[stage].append(seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    self._buckets[stage][i] += 1
+            self._sums[stage] += seconds
+            self._counts[stage] += 1
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time the enclosed block as one observation of stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, counter: str, value: float = 1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def record_startup(self, phase: str, seconds: float):
+        """Record the duration of a cold-start phase; only the first value per process is kept."""
+        with self._lock:
+            if phase in self._startup:
+                return
+            self._startup[phase] = seconds
+        print(f"Startup {phase}: {seconds:.2f}s")
+
+    def register_collector(self, name: str, collect: Callable[[], Optional[Dict[str, Any]]]):
+        """Export the numeric values of collect() as gauges named <name>_<key>."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def _collect(self) -> Dict[str, float]:
+        gauges = {}
+        for name, collect in list(self._collectors.items()):
+            try:
+                values = collect() or {}
+            except Exception as e:
+                print(f"Error collecting metrics from {name}: {str(e)}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{name}_{key}"] = value
+        return gauges
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Rolling-window percentiles per stage (ms), counters and gauges."""
+        with self._lock:
+            recent = {stage: list(values) for stage, values in self._recent.items()}
+            counts = dict(self._counts)
+            counters = dict(self._counters)
+            startup = dict(self._startup)
+        stages = {}
+        for stage, values in recent.items():
+            ms = np.asarray(values) * 1000
+            stages[stage] = {
+                "count": counts[stage],
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99))
+            }
+        return {"stages": stages, "counters": counters, "gauges": self._collect(), "startup": startup}
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            buckets = {stage: list(values) for stage, values in self._buckets.items()}
+            sums = dict(self._sums)
+            counts = dict(self._counts)
+            counters = dict(self._counters)
+            startup = dict(self._startup)
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Latency of query pipeline stages.",
+            f"# TYPE {PREFIX}_stage_seconds histogram"
+        ]
+        for stage in sorted(buckets):
+            for bound, count in zip(BUCKETS, buckets[stage]):
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {counts[stage]}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {sums[stage]}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {counts[stage]}')
+        if startup:
+            lines.append(f"# HELP {PREFIX}_startup_seconds Duration of cold-start phases.")
+            lines.append(f"# TYPE {PREFIX}_startup_seconds gauge")
+            for phase in sorted(startup):
+                lines.append(f'{PREFIX}_startup_seconds{{phase="{phase}"}} {startup[phase]}')
+        for counter in sorted(counters):
+            lines.append(f"# TYPE {PREFIX}_{counter}_total counter")
+            lines.append(f"{PREFIX}_{counter}_total {counters[counter]}")
+        for gauge, value in sorted(self._collect().items()):
+            lines.append(f"# TYPE {PREFIX}_{gauge} gauge")
+            lines.append(f"{PREFIX}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every module and session in the process
+metrics = Metrics(METRICS_WINDOW)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics in a daemon thread. Safe to call repeatedly; starts once per process."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics endpoint on {host}:{port}: {str(e)}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
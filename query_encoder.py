@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+import numpy as np
+
+class BatchingEncoder:
+    """Encodes concurrent queries together in one forward pass.
+
+    Callers block in encode() while a single worker thread collects the
+    queries arriving within window_ms of the first one (up to max_batch),
+    encodes them in one batched call and hands each caller its embedding.
+    The worker is the only thread running the model, so no lock is needed.
+    """
+
+    def __init__(self, get_model: Callable[[], Any], window_ms: float = 5, max_batch: int = 32, stats_window: int = 500):
+        self.get_model = get_model
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._worker = None
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+        self.last_encode_ms = 0.0
+        self._last_batch_size = 0
+        self._waits: deque = deque(maxlen=stats_window)
+
+    def encode(self, text: str) -> np.ndarray:
+        """Embedding of text as a read-only float32 vector, computed in the next batch."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                    self._worker.start()
+
+    def _collect(self) -> List[tuple]:
+        """Block for the first query, then gather the ones arriving within the window.
+
+        A query arriving alone after a single-query batch is encoded at once:
+        the window only pays off under concurrency, which shows up as queries
+        queueing while the previous batch was being encoded.
+        """
+        batch = [self._queue.get()]
+        concurrent = self._last_batch_size > 1 or not self._queue.empty()
+        deadline = time.perf_counter() + (self.window if concurrent else 0)
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._last_batch_size = len(batch)
+            started = time.perf_counter()
+            # Identical queries in one batch are encoded once
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                embeddings = self.get_model().encode(texts, batch_size=len(texts))
+            except Exception as e:
+                print(f"Error encoding query batch: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            by_text = {}
+            for text, embedding in zip(texts, embeddings):
+                # Shared by every caller and the query cache, so nobody may modify it
+                vector = np.array(embedding, dtype=np.float32)
+                vector.flags.writeable = False
+                by_text[text] = vector
+            for text, future, _ in batch:
+                future.set_result(by_text[text])
+            self._record(batch, started)
+
+    def _record(self, batch: List[tuple], started: float):
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.last_encode_ms = (time.perf_counter() - started) * 1000
+            self._waits.extend((started - enqueued) * 1000 for _, _, enqueued in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch sizes and the time queries waited for their batch to start."""
+        with self._stats_lock:
+            waits = np.asarray(self._waits) if self._waits else np.zeros(1)
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_wait_ms": float(waits.mean()),
+                "p95_wait_ms": float(np.percentile(waits, 95)),
+                "last_encode_ms": self.last_encode_ms
+            }
@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import List, Dict, Any
+from cache_service import LRUCache
+
+class CrossEncoderReranker:
+    """Rescores retrieval candidates with a cross-encoder in one batched forward pass.
+
+    Scores are cached per (query, chunk content), so only pairs not seen
+    before reach the model. Content rather than the chunk id is the key:
+    ids are reassigned on re-ingest, while the score depends on the text
+    alone. Latency is tracked separately from retrieval.
+    """
+
+    def __init__(self, model, cache: LRUCache, batch_size: int = 64):
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.pairs_scored = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+
+    def rerank(self, query: str, chunks: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Return the top_k chunks by cross-encoder score, best first."""
+        if not chunks:
+            return []
+        start = time.perf_counter()
+        normalized_query = " ".join(query.lower().split())
+        scores = [self.cache.get((normalized_query, chunk["content"])) for chunk in chunks]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            pairs = [(query, chunks[i]["content"]) for i in missing]
+            with self._lock:
+                predicted = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                self.cache.set((normalized_query, chunks[i]["content"]), scores[i])
+
+        ranked = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:top_k]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.calls += 1
+        self.pairs_scored += len(missing)
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        return [dict(chunks[i], rerank_score=scores[i]) for i in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        """Reranker latency and pair-score cache counters."""
+        cache_stats = self.cache.stats()
+        return {
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored,
+            "last_ms": self.last_ms,
+            "avg_ms": self.total_ms / self.calls if self.calls else 0.0,
+            "cache_hits": cache_stats["hits"],
+            "cache_misses": cache_stats["misses"]
+        }
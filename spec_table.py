@@ -0,0 +1,172 @@
+import json
+import os
+import re
+from typing import List, Dict, Any, Optional, Tuple
+import pandas as pd
+from lexical_index import tokenize
+from vector_store import IndexFileWatcher
+
+# A first column with one of these headers lists products in rows; otherwise
+# the first column holds attribute names and every other column is a product
+PRODUCT_HEADERS = {"model", "models", "product", "products", "scanner", "scanners", "name"}
+
+def clean_cell(value) -> Optional[str]:
+    if pd.isnull(value):
+        return None
+    text = " ".join(str(value).split())
+    return text or None
+
+def product_terms(name: str) -> set:
+    """Match terms of a product name: its tokens plus each run of leading words
+    joined without separators ("CR 120 UV" -> "cr120", "cr120uv")."""
+    words = re.findall(r"[a-z0-9]+", name.lower())
+    return set(tokenize(name)) | {"".join(words[:end]) for end in range(2, len(words) + 1)}
+
+def is_model_term(term: str) -> bool:
+    # Brand words are shared by many products; model numbers identify one
+    return any(c.isdigit() for c in term)
+
+
+class SpecTable:
+    """Product x attribute specifications extracted from comparison spreadsheets.
+
+    Built by ingest_documents.py and persisted as `specs.json` next to the
+    other index files. Products are looked up through an inverted index of
+    their model-number terms, so resolving the products of a comparison
+    query is a few dictionary lookups.
+    """
+
+    FILE = "specs.json"
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        # Each product: {"name", "source", "attribute_header", "specs": [[attribute, value], ...]}
+        self.products = products
+        self.terms: Dict[str, List[int]] = {}
+        for i, product in enumerate(products):
+            for term in product_terms(product["name"]):
+                if is_model_term(term):
+                    self.terms.setdefault(term, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    @classmethod
+    def empty(cls) -> "SpecTable":
+        return cls([])
+
+    @staticmethod
+    def products_from_frame(df: pd.DataFrame, source: str) -> List[Dict[str, Any]]:
+        """Read the products of one spreadsheet, in either orientation."""
+        df = df.dropna(how="all").dropna(axis=1, how="all")
+        if df.shape[1] < 2 or df.empty:
+            return []
+        headers = [clean_cell(header) for header in df.columns]
+        if any(header is None or header.startswith("Unnamed:") for header in headers):
+            return []
+        first = df.iloc[:, 0].map(clean_cell)
+        if headers[0].lower() in PRODUCT_HEADERS:
+            # One product per row, one attribute per column
+            names, attributes, grid = first.tolist(), headers[1:], df.iloc[:, 1:].to_numpy().tolist()
+        else:
+            # One attribute per row, one product per column
+            names, attributes, grid = headers[1:], first.tolist(), df.iloc[:, 1:].T.to_numpy().tolist()
+        products = []
+        for name, values in zip(names, grid):
+            specs = [
+                [attribute, clean_cell(value)]
+                for attribute, value in zip(attributes, values)
+                if attribute is not None and clean_cell(value) is not None
+            ]
+            if name and specs:
+                products.append({"name": name, "source": source, "attribute_header": headers[0], "specs": specs})
+        return products
+
+    @classmethod
+    def build(cls, spreadsheet_paths: List[str]) -> "SpecTable":
+        products = []
+        for file_path in spreadsheet_paths:
+            try:
+                products.extend(cls.products_from_frame(pd.read_excel(file_path), os.path.basename(file_path)))
+            except Exception as e:
+                print(f"Error reading specs from {file_path}: {str(e)}")
+        return cls(products)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "SpecTable":
+        with open(os.path.join(index_dir, cls.FILE), "r", encoding="utf-8") as f:
+            return cls(json.load(f)["products"])
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        path = os.path.join(index_dir, self.FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"products": self.products}, f)
+        os.replace(path + ".tmp", path)
+
+    def find(self, entity: str) -> Optional[Dict[str, Any]]:
+        """The product an entity of a comparison query names, if it is in the table.
+
+        Candidates share a model-number term with the entity. If the entity
+        names a model with letters ("CR-120", "fi-7140"), that exact model
+        must match, so a bare "120" does not pull in other products. The
+        candidate sharing the most terms with the entity, counting its
+        source file name, wins.
+        """
+        entity_terms = set(tokenize(entity))
+        candidates = {i for term in entity_terms if term in self.terms for i in self.terms[term]}
+        models = {term for term in entity_terms if is_model_term(term) and any(c.isalpha() for c in term)}
+        if models:
+            candidates = {i for i in candidates if models & product_terms(self.products[i]["name"])}
+        if not candidates:
+            return None
+
+        def score(i: int) -> Tuple[int, int]:
+            product = self.products[i]
+            return (
+                len(entity_terms & product_terms(product["name"])),
+                len(entity_terms & set(tokenize(product["source"])))
+            )
+        return self.products[max(sorted(candidates), key=score)]
+
+    def lookup(self, entities: List[str]) -> Optional[List[Dict[str, Any]]]:
+        """Products for every entity, or None unless all of them (and at least two) are known."""
+        products = []
+        for entity in entities:
+            product = self.find(entity)
+            if product is None:
+                return None
+            if product not in products:
+                products.append(product)
+        return products if len(products) >= 2 else None
+
+    @staticmethod
+    def format(products: List[Dict[str, Any]]) -> str:
+        """Pipe-separated comparison grid of the products, labelled with their sources."""
+        attributes: List[str] = []
+        values: List[Dict[str, str]] = []
+        for product in products:
+            specs = dict((attribute, value) for attribute, value in product["specs"])
+            values.append(specs)
+            attributes.extend(attribute for attribute in specs if attribute not in attributes)
+        sources = ", ".join(dict.fromkeys(product["source"] for product in products))
+        lines = [
+            f"[{sources} specification table]",
+            " | ".join([products[0]["attribute_header"]] + [product["name"] for product in products])
+        ]
+        for attribute in attributes:
+            lines.append(" | ".join([attribute] + [specs.get(attribute, "-") for specs in values]))
+        return "\n".join(lines)
+
+
+class SpecStore:
+    """Specification lookups over the SpecTable written by ingest_documents.py."""
+
+    def __init__(self, index_dir: str):
+        self._watcher = IndexFileWatcher(index_dir, SpecTable.FILE, SpecTable.load, SpecTable.empty())
+
+    @property
+    def table(self) -> SpecTable:
+        return self._watcher.get()
+
+    def lookup(self, entities: List[str]) -> Optional[List[Dict[str, Any]]]:
+        return self.table.lookup(entities)
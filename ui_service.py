@@ -1,12 +1,32 @@
 import streamlit as st
 import pandas as pd
 from typing import List, Dict, Any
-from config import PAGE_TITLE, PAGE_ICON, LAYOUT, INPUT_DIRS
+from config import (
+    PAGE_TITLE,
+    PAGE_ICON,
+    LAYOUT,
+    INPUT_DIRS,
+    CHAT_HISTORY_WINDOW,
+    DOCUMENT_CATALOG_CHECK_SECONDS,
+    DOWNLOAD_CACHE_ENTRIES
+)
+from document_catalog import DocumentCatalog
 import os
 
+@st.cache_resource(max_entries=DOWNLOAD_CACHE_ENTRIES, show_spinner=False)
+def read_document(path: str, mtime: float) -> bytes:
+    """Bytes of a document, one copy shared by every session.
+
+    mtime is part of the key, so a changed file is read again once prepared anew.
+    """
+    with open(path, "rb") as f:
+        return f.read()
+
 class UIService:
     def __init__(self):
         self.setup_styles()
+        # UIService is a process-wide resource, so every session shares the listing
+        self.document_catalog = DocumentCatalog(INPUT_DIRS, DOCUMENT_CATALOG_CHECK_SECONDS)
         
     def format_response(self, text: str) -> str:
         """Format the response text with better styling."""
@@ -322,14 +342,7 @@ class UIService:
         st.sidebar.markdown("---")
         st.sidebar.markdown("**Source Documents**")
         
-        # Add a dropdown to select documents instead of loading all at once
-        available_docs = []
-        for input_dir in INPUT_DIRS:
-            if os.path.exists(input_dir):
-                for fname in os.listdir(input_dir):
-                    fpath = os.path.join(input_dir, fname)
-                    if os.path.isfile(fpath):
-                        available_docs.append((fname, fpath))
+        available_docs = self.document_catalog.documents()
         
         if available_docs:
             # Only show a dropdown if there are documents
@@ -339,48 +352,120 @@ class UIService:
                 index=0
             )
             
-            # Only load the selected document
             selected_path = next((doc[1] for doc in available_docs if doc[0] == selected_doc), None)
-            if selected_path:
-                with open(selected_path, "rb") as f:
-                    st.sidebar.download_button(
-                        label=f"Download {selected_doc}",
-                        data=f,
-                        file_name=selected_doc
-                    )
+            if not selected_path:
+                return
+            # The file is only read once a download is asked for; sessions keep just its path
+            prepared = st.session_state.get("prepared_download")
+            data = None
+            if prepared and prepared["path"] == selected_path:
+                try:
+                    data = read_document(prepared["path"], prepared["mtime"])
+                except OSError as e:
+                    print(f"Error reading {selected_path}: {str(e)}")
+            if data is not None:
+                st.sidebar.download_button(
+                    label=f"Download {selected_doc}",
+                    data=data,
+                    file_name=selected_doc
+                )
+            else:
+                st.session_state.prepared_download = None
+                st.sidebar.button(
+                    f"Prepare {selected_doc}",
+                    on_click=self.prepare_download,
+                    args=(selected_path,)
+                )
+
+    def prepare_download(self, path: str):
+        """Make a document available to the download button of the current session."""
+        try:
+            st.session_state.prepared_download = {"path": path, "mtime": os.path.getmtime(path)}
+        except OSError as e:
+            print(f"Error reading {path}: {str(e)}")
+            st.session_state.prepared_download = None
+
+    def display_cache_stats(self, label: str, stats: Dict[str, Any]):
+        """Show a cache's hit rate in the sidebar."""
+        lookups = stats["hits"] + stats["misses"]
+        st.sidebar.caption(
+            f"{label}: {stats['hits']}/{lookups} hits ({stats['hit_rate']:.0%}), {stats['size']} entries"
+        )
+
+    def display_rerank_stats(self, stats: Dict[str, Any]):
+        """Show reranker latency in the sidebar."""
+        st.sidebar.caption(
+            f"Reranker: {stats['last_ms']:.1f} ms last, {stats['avg_ms']:.1f} ms avg over {stats['calls']} queries"
+        )
+
+    def display_diagnostics(self, snapshot: Dict[str, Any]):
+        """Show per-stage latency percentiles and counters in a sidebar panel."""
+        with st.sidebar.expander("Diagnostics", expanded=True):
+            if snapshot["stages"]:
+                st.dataframe(
+                    pd.DataFrame(snapshot["stages"]).T.round(1),
+                    use_container_width=True
+                )
+            else:
+                st.caption("No queries timed yet.")
+            if snapshot.get("startup"):
+                st.caption("Startup: " + ", ".join(
+                    f"{phase} {seconds:.2f}s" for phase, seconds in snapshot["startup"].items()
+                ))
+            values = dict(snapshot["counters"], **snapshot["gauges"])
+            for name in sorted(values):
+                value = values[name]
+                st.caption(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
 
     def display_chat_history(self, chat_history: List[Dict[str, Any]]):
-        """Display the chat history using Streamlit's native chat components."""
-        # Keep track of which messages have been displayed
-        if "_displayed_messages" not in st.session_state:
-            st.session_state._displayed_messages = set()
-            
-        for i, msg in enumerate(chat_history):
-            # Create a unique identifier for this message
-            msg_id = f"{msg['role']}_{i}"
-            
-            # Only display messages we haven't shown yet
-            if msg_id not in st.session_state._displayed_messages:
-                if msg["role"] == "user":
-                    with st.chat_message("user"):
-                        st.write(msg["content"])
-                else:
-                    with st.chat_message("assistant"):
-                        self.display_response(
-                            msg["content"],
-                            msg.get("sources", []),
-                            msg.get("is_table", False)
-                        )
-                # Mark this message as displayed
-                st.session_state._displayed_messages.add(msg_id)
-
-    def display_response(self, response: str, sources: List[Dict[str, Any]], is_table: bool = False):
-        """Display a response from the assistant."""
+        """Display one page of the chat history using Streamlit's native chat components.
+
+        Only the latest CHAT_HISTORY_WINDOW messages are shown by default; older
+        turns are reached with the pagination buttons. Assistant messages reuse
+        the output stored by render_response, so a rerun costs the same no
+        matter how long the conversation is.
+        """
+        if "history_page" not in st.session_state:
+            st.session_state.history_page = 0
+        pages = max(1, -(-len(chat_history) // CHAT_HISTORY_WINDOW))
+        page = min(st.session_state.history_page, pages - 1)
+        end = len(chat_history) - page * CHAT_HISTORY_WINDOW
+        start = max(0, end - CHAT_HISTORY_WINDOW)
+
+        if pages > 1:
+            self.display_history_pagination(page, pages, start, end, len(chat_history))
+
+        for msg in chat_history[start:end]:
+            if msg["role"] == "user":
+                with st.chat_message("user"):
+                    st.write(msg["content"])
+            else:
+                # Messages from before rendering was cached are rendered once here
+                if "rendered" not in msg:
+                    msg["rendered"] = self.render_response(msg["content"], msg.get("is_table", False))
+                with st.chat_message("assistant"):
+                    self.display_rendered(msg["rendered"], msg.get("sources", []))
+
+    def display_history_pagination(self, page: int, pages: int, start: int, end: int, total: int):
+        """Buttons to move between pages of older chat turns."""
+        def move(step: int):
+            st.session_state.history_page = min(max(page + step, 0), pages - 1)
+
+        earlier, info, later = st.columns([1, 3, 1])
+        earlier.button("◀ Earlier", on_click=move, args=(1,), disabled=page >= pages - 1, key="history_earlier")
+        info.caption(f"Showing messages {start + 1}–{end} of {total}")
+        later.button("Later ▶", on_click=move, args=(-1,), disabled=page == 0, key="history_later")
+
+    def render_response(self, response: str, is_table: bool = False) -> Dict[str, Any]:
+        """Format a response once into what display_rendered shows.
+
+        Returns {"table": DataFrame} for comparison tables and {"html": str}
+        for everything else, so it can be stored with the chat message.
+        """
         if is_table:
             try:
                 # Try to parse HTML table
-                df = pd.read_html(response)[0]
-                st.write(df)
+                return {"table": pd.read_html(response)[0]}
             except Exception:
                 # If it's not a valid HTML table, try to format it as a table
                 try:
@@ -390,33 +475,26 @@ class UIService:
                         # Create a simple table from the text
                         data = [line.split('|') for line in lines if '|' in line]
                         if data:
-                            df = pd.DataFrame(data[1:], columns=data[0])
-                            st.write(df)
-                        else:
-                            # Format with markdown
-                            st.markdown(
-                                f'<div class="stChatMessage bot-msg">{self.format_response(response)}</div>',
-                                unsafe_allow_html=True
-                            )
-                    else:
-                        # Format with markdown
-                        st.markdown(
-                            f'<div class="stChatMessage bot-msg">{self.format_response(response)}</div>',
-                            unsafe_allow_html=True
-                        )
+                            return {"table": pd.DataFrame(data[1:], columns=data[0])}
                 except Exception:
                     # Fall back to basic formatting
-                    st.markdown(
-                        f'<div class="stChatMessage bot-msg">{self.format_response(response)}</div>',
-                        unsafe_allow_html=True
-                    )
+                    pass
+        # Format regular responses with better styling
+        return {"html": f'<div class="stChatMessage bot-msg">{self.format_response(response)}</div>'}
+
+    def display_rendered(self, rendered: Dict[str, Any], sources: List[Dict[str, Any]]):
+        """Display a response prepared by render_response."""
+        if "table" in rendered:
+            st.write(rendered["table"])
         else:
-            # Format regular responses with better styling
-            st.markdown(
-                f'<div class="stChatMessage bot-msg">{self.format_response(response)}</div>',
-                unsafe_allow_html=True
-            )
-        
+            st.markdown(rendered["html"], unsafe_allow_html=True)
+
         # Display sources if available
         if sources:
-            st.caption(sources)
\ No newline at end of file
+            st.caption(sources)
+
+    def display_response(self, response: str, sources: List[Dict[str, Any]], is_table: bool = False) -> Dict[str, Any]:
+        """Display a response from the assistant and return its rendered form."""
+        rendered = self.render_response(response, is_table)
+        self.display_rendered(rendered, sources)
+        return rendered
@@ -0,0 +1,324 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from quantization import precision_of, quantize, dequantize, quantized_scores, vector_literal
+from ann_index import IVFIndex
+
+INDEX_VERSION_FILE = "version"
+
+def read_index_version(index_dir: str) -> str:
+    """Version of the ingested document set, or "" if nothing has been ingested."""
+    try:
+        with open(os.path.join(index_dir, INDEX_VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def write_index_version(index_dir: str, version: str):
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, INDEX_VERSION_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(path + ".tmp", path)
+
+class LocalVectorIndex:
+    """Normalized chunk embeddings in a memory-mapped matrix plus chunk metadata.
+
+    The index is a directory holding `embeddings.npy` (one row per chunk, in
+    the precision it was built with: float32, float16 or int8), `scales.npy`
+    (the per-row scales of an int8 matrix), `ivf.npz` (the optional IVF
+    partitions of the rows, for approximate search) and `chunks.json` (the
+    chunk records, in the same row order). Search runs on the stored codes.
+    """
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    SCALES_FILE = "scales.npy"
+    CHUNKS_FILE = "chunks.json"
+
+    def __init__(self, embeddings: np.ndarray, chunks: List[Dict[str, Any]], scales: Optional[np.ndarray] = None,
+                 ivf: Optional[IVFIndex] = None):
+        self._embeddings = embeddings
+        self._scales = scales
+        self.ivf = ivf
+        # (codes, scales) appended by add() since the matrix was last consolidated
+        self._pending: List[Tuple[np.ndarray, Optional[np.ndarray]]] = []
+        self.chunks = chunks
+        self.next_id = max((chunk["id"] for chunk in chunks), default=0) + 1
+
+    def _consolidate(self):
+        if self._pending:
+            self._embeddings = np.vstack([np.asarray(self._embeddings)] + [codes for codes, _ in self._pending])
+            if self._scales is not None:
+                self._scales = np.concatenate([np.asarray(self._scales)] + [scales for _, scales in self._pending])
+            self._pending = []
+
+    def _set(self, embeddings: np.ndarray, scales: Optional[np.ndarray]):
+        self._embeddings = embeddings
+        self._scales = scales
+        self._pending = []
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """The stored codes, in the index precision."""
+        self._consolidate()
+        return self._embeddings
+
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        """Per-row scales of an int8 index, None otherwise."""
+        self._consolidate()
+        return self._scales
+
+    @property
+    def precision(self) -> str:
+        return precision_of(self._embeddings)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize rows so that a dot product is a cosine similarity."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def empty(cls, dim: int = 0, precision: str = "float32") -> "LocalVectorIndex":
+        embeddings, scales = quantize(np.zeros((0, dim), dtype=np.float32), precision)
+        return cls(embeddings, [], scales)
+
+    @classmethod
+    def exists(cls, index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, cls.CHUNKS_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "LocalVectorIndex":
+        """Load an index, memory-mapping the embedding matrix. Missing indexes load empty."""
+        if not cls.exists(index_dir):
+            return cls.empty()
+        with open(os.path.join(index_dir, cls.CHUNKS_FILE), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        embeddings = np.load(
+            os.path.join(index_dir, cls.EMBEDDINGS_FILE),
+            mmap_mode="r" if mmap else None
+        )
+        scales = None
+        if embeddings.dtype == np.int8:
+            scales = np.load(os.path.join(index_dir, cls.SCALES_FILE))
+            if scales.shape[0] != embeddings.shape[0]:
+                raise ValueError(f"Index at {index_dir} is inconsistent: {embeddings.shape[0]} embeddings, {scales.shape[0]} scales")
+        if embeddings.shape[0] != len(chunks):
+            raise ValueError(f"Index at {index_dir} is inconsistent: {embeddings.shape[0]} embeddings, {len(chunks)} chunks")
+        ivf = IVFIndex.load(index_dir)
+        if ivf is not None and len(ivf) != len(chunks):
+            raise ValueError(f"Index at {index_dir} is inconsistent: {len(ivf)} IVF rows, {len(chunks)} chunks")
+        return cls(embeddings, chunks, scales, ivf)
+
+    def save(self, index_dir: str):
+        """Write the index, replacing each file atomically.
+
+        chunks.json is replaced last: readers reload when it changes.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        embeddings_path = os.path.join(index_dir, self.EMBEDDINGS_FILE)
+        scales_path = os.path.join(index_dir, self.SCALES_FILE)
+        ivf_path = os.path.join(index_dir, IVFIndex.FILE)
+        chunks_path = os.path.join(index_dir, self.CHUNKS_FILE)
+        # np.save appends .npy to names that lack it
+        with open(embeddings_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.embeddings))
+        if self.scales is not None:
+            with open(scales_path + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(self.scales, dtype=np.float32))
+        if self.ivf is not None:
+            self.ivf.save(ivf_path + ".tmp")
+        with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f)
+        if self.scales is not None:
+            os.replace(scales_path + ".tmp", scales_path)
+        elif os.path.exists(scales_path):
+            os.remove(scales_path)
+        if self.ivf is not None:
+            os.replace(ivf_path + ".tmp", ivf_path)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+        os.replace(embeddings_path + ".tmp", embeddings_path)
+        os.replace(chunks_path + ".tmp", chunks_path)
+
+    def vectors(self) -> np.ndarray:
+        """The embeddings decoded to float32."""
+        return dequantize(self.embeddings, self.scales)
+
+    def with_precision(self, precision: str) -> "LocalVectorIndex":
+        """This index re-encoded in another precision (self if it already matches)."""
+        if precision == self.precision:
+            return self
+        embeddings, scales = quantize(self.vectors(), precision)
+        index = LocalVectorIndex(embeddings, self.chunks, scales, self.ivf)
+        index.next_id = self.next_id
+        return index
+
+    def sources(self) -> List[str]:
+        return sorted({chunk["source"] for chunk in self.chunks})
+
+    def remove_source(self, source: str, up_to_id: Optional[int] = None, after_id: Optional[int] = None):
+        """Drop the chunks of a source, optionally restricted to an id range."""
+        def removed(chunk):
+            return (
+                chunk["source"] == source
+                and (up_to_id is None or chunk["id"] <= up_to_id)
+                and (after_id is None or chunk["id"] > after_id)
+            )
+        keep = [i for i, chunk in enumerate(self.chunks) if not removed(chunk)]
+        if len(keep) == len(self.chunks):
+            return
+        scales = self.scales
+        self._set(np.asarray(self.embeddings)[keep], None if scales is None else np.asarray(scales)[keep])
+        self.chunks = [self.chunks[i] for i in keep]
+        if self.ivf is not None:
+            self.ivf.keep(keep)
+
+    def update_ivf(self, min_chunks: int, lists: int = 0):
+        """Keep the IVF partitions in step with the index size.
+
+        Indexes under min_chunks are searched exactly and get none. Rows added
+        since training were already assigned by add(); the centroids are
+        refitted only once the index has halved or doubled since then.
+        """
+        if len(self) < min_chunks:
+            self.ivf = None
+        elif self.ivf is None or self.ivf.needs_training(len(self)):
+            start = time.perf_counter()
+            self.ivf = IVFIndex.train(self.embeddings, lists)
+            print(f"Trained IVF index: {self.ivf.lists} partitions over {len(self)} chunks in {time.perf_counter() - start:.1f}s")
+
+    def add(self, docs: List[Dict[str, Any]], embeddings: np.ndarray):
+        """Append chunks with their embeddings, assigning increasing ids.
+
+        Embeddings are normalized and encoded in the index precision. Rows
+        are stacked onto the matrix lazily, so adding many small batches
+        during ingest does not copy the whole matrix each time.
+        """
+        if not docs:
+            return
+        codes, scales = quantize(self.normalize(embeddings), self.precision)
+        if self.ivf is not None:
+            self.ivf.add(codes)
+        if len(self.chunks):
+            self._pending.append((codes, scales))
+        else:
+            self._set(codes, scales)
+        for offset, doc in enumerate(docs):
+            self.chunks.append({
+                "id": self.next_id + offset,
+                "content": doc["content"],
+                "source": doc["source"],
+                "page_num": doc["page_num"],
+                "metadata": doc["metadata"]
+            })
+        self.next_id += len(docs)
+
+    def search(self, query_embedding: np.ndarray, top_k: int, probes: int = 0) -> List[Dict[str, Any]]:
+        """Return the top_k chunks by cosine similarity, best first.
+
+        With probes > 0 and IVF partitions present, only the rows of the
+        `probes` partitions nearest to the query are scored (approximate);
+        otherwise every row is.
+        """
+        if not self.chunks or top_k <= 0:
+            return []
+        query = self.normalize(query_embedding)
+        rows = None
+        if probes > 0 and self.ivf is not None:
+            rows = self.ivf.candidates(query, probes)
+            if len(rows) < top_k:
+                rows = None
+        if rows is None:
+            scores = quantized_scores(self.embeddings, self.scales, query)
+        else:
+            scales = self.scales
+            scores = quantized_scores(self.embeddings[rows], None if scales is None else scales[rows], query)
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        ids = ranked if rows is None else rows[ranked]
+        return [dict(self.chunks[i], similarity=float(scores[r])) for i, r in zip(ids, ranked)]
+
+
+class SupabaseVectorStore:
+    """Retrieval through the Supabase match_documents RPC."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        response = self.client.rpc(
+            "match_documents",
+            {"query_embedding": vector_literal(query_embedding), "match_count": top_k}
+        ).execute()
+
+        if hasattr(response, 'data'):
+            return response.data
+        return []
+
+
+class IndexFileWatcher:
+    """An artifact loaded from an index directory, reloaded when its file changes.
+
+    Ingest replaces index files atomically, so checking the mtime of the
+    watched file on access is enough to pick up a re-ingest without a restart.
+    """
+
+    def __init__(self, index_dir: str, filename: str, loader, empty):
+        self.index_dir = index_dir
+        self.path = os.path.join(index_dir, filename)
+        self.loader = loader
+        self.value = empty
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.value
+        if mtime == self._mtime:
+            return self.value
+        # Sessions share this watcher; only one of them reloads
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    self.value = self.loader(self.index_dir)
+                    self._mtime = mtime
+                except Exception as e:
+                    # Most likely caught mid-write by ingest; keep serving the old copy
+                    print(f"Error loading {self.path}: {str(e)}")
+        return self.value
+
+
+class LocalVectorStore:
+    """In-process retrieval over the LocalVectorIndex written by ingest_documents.py."""
+
+    def __init__(self, index_dir: str, probes: int = 0):
+        self.index_dir = index_dir
+        # IVF partitions scanned per query; 0 always searches exactly
+        self.probes = probes
+        self._watcher = IndexFileWatcher(
+            index_dir,
+            LocalVectorIndex.CHUNKS_FILE,
+            LocalVectorIndex.load,
+            LocalVectorIndex.empty()
+        )
+
+    @property
+    def index(self) -> LocalVectorIndex:
+        return self._watcher.get()
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        return self.index.search(query_embedding, top_k, self.probes)